@@ -1,13 +1,61 @@
-import os 
+import os
 import subprocess
+import time
+from concurrent.futures import ThreadPoolExecutor, as_completed
 
-files= os.listdir("videos")
+# Whisper works on 16 kHz mono samples, so extract exactly that as PCM WAV:
+# no lossy MP3 encode here and no MP3 decode again in 02speech_to_text.py
+SAMPLE_RATE = 16000
+WORKERS = int(os.getenv("FFMPEG_WORKERS", str(os.cpu_count() or 1)))
 
-# print(files)
-
-for file in files:
+def audio_path(file):
     number=file.split("_")[0]
     name=file.split("_")[1]
-    print(number, name)
-    subprocess.run(["ffmpeg","-i",f"videos/{file}",
-                   f"audio/{number}_{name}.mp3" ])
\ No newline at end of file
+    return f"audio/{number}_{name}.wav"
+
+def up_to_date(src, dst):
+    return os.path.exists(dst) and os.path.getmtime(dst) >= os.path.getmtime(src)
+
+def extract_audio(file):
+    src, dst = f"videos/{file}", audio_path(file)
+    # Hidden partial file, so an interrupted run never looks finished
+    tmp = os.path.join("audio", "." + os.path.basename(dst) + ".part")
+    started = time.perf_counter()
+    # One decode thread per ffmpeg; the pool provides the parallelism
+    try:
+        subprocess.run(["ffmpeg", "-nostdin", "-hide_banner", "-loglevel", "error", "-y",
+                        "-threads", "1", "-i", src,
+                        "-vn", "-ac", "1", "-ar", str(SAMPLE_RATE), "-c:a", "pcm_s16le", "-f", "wav", tmp],
+                       check=True)
+    except subprocess.CalledProcessError:
+        if os.path.exists(tmp):
+            os.remove(tmp)
+        raise
+    os.replace(tmp, dst)
+    seconds = time.perf_counter() - started
+    audio_seconds = (os.path.getsize(dst) - 44) / (SAMPLE_RATE * 2)
+    return dst, seconds, os.path.getsize(src), audio_seconds
+
+if __name__ == "__main__":
+    os.makedirs("audio", exist_ok=True)
+    files = [f for f in os.listdir("videos") if "_" in f]
+    todo = [f for f in files if not up_to_date(f"videos/{f}", audio_path(f))]
+    print(f"{len(files) - len(todo)} up to date, {len(todo)} to extract with {WORKERS} workers")
+
+    started = time.perf_counter()
+    total_bytes = 0
+    with ThreadPoolExecutor(max_workers=WORKERS) as pool:
+        futures = {pool.submit(extract_audio, f): f for f in todo}
+        for future in as_completed(futures):
+            try:
+                dst, seconds, size, audio_seconds = future.result()
+            except subprocess.CalledProcessError as e:
+                print(f"❌ {futures[future]}: ffmpeg exited with {e.returncode}")
+                continue
+            total_bytes += size
+            print(f"✅ {dst}: {seconds:.1f}s, {size / 2**20 / seconds:.1f} MB/s, "
+                  f"{audio_seconds / seconds:.0f}x realtime")
+
+    elapsed = time.perf_counter() - started
+    if todo:
+        print(f"Done in {elapsed:.1f}s ({total_bytes / 2**20 / elapsed:.1f} MB/s overall)")
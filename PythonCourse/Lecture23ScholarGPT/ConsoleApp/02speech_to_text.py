@@ -1,32 +1,201 @@
 import whisper
 import json
-import os 
-
-model=whisper.load_model("base")
-audios=os.listdir("audio")
-
-print(audios)
-
-for audio_file in audios:
-    if("_" in audio_file):
-        number=audio_file.split("_")[0]
-        name=audio_file.split("_")[1]
-        print(number, name)
-        result=model.transcribe(audio=f"audio/{audio_file}",
-                                language="ur",
-                                task="translate",
-                                word_timestamps=False)
-        
-        print(result)
-        chunks=[]
-        for segment in result["segments"]:
-            chunks.append({"number":number,
-                           "name":name,
-                           "start":segment["start"],
-                           "end":segment["end"],
-                           "text":segment["text"]})
-        chunks_with_all_meta_data={"chunks":chunks,"text":result["text"]}
-        
-
-        with open(f"jsons/{audio_file}.json","w") as f:
-            json.dump(chunks_with_all_meta_data,f)
\ No newline at end of file
+import os
+import subprocess
+import time
+import numpy as np
+from concurrent.futures import ProcessPoolExecutor, as_completed
+
+# Files are shared out to worker processes; each loads its own model once
+# and uses THREADS torch threads, so WORKERS * THREADS ~ the core count
+MODEL_NAME = os.getenv("WHISPER_MODEL", "base")
+WORKERS = int(os.getenv("WHISPER_WORKERS", "2"))
+THREADS = int(os.getenv("WHISPER_THREADS", str(max(1, (os.cpu_count() or 1) // WORKERS))))
+# Skip silence: only the speech regions found by an energy VAD are decoded
+VAD = os.getenv("WHISPER_VAD", "1") == "1"
+SAMPLE_RATE = whisper.audio.SAMPLE_RATE
+# Long lectures are decoded in WINDOW-second pieces (plus OVERLAP), so memory
+# stays flat whatever the length; WHISPER_WINDOW=0 decodes whole files
+WINDOW = float(os.getenv("WHISPER_WINDOW", "600"))
+OVERLAP = float(os.getenv("WHISPER_OVERLAP", "10"))
+
+model = None
+
+def init_worker(threads):
+    global model
+    import torch
+    torch.set_num_threads(threads)
+    model = whisper.load_model(MODEL_NAME, device="cpu")
+
+def speech_regions(audio, frame=0.03, threshold_db=-35.0, floor_dbfs=-50.0, min_silence=0.6, pad=0.2):
+    """Speech as [start, end, start, end, ...] seconds, for clip_timestamps.
+
+    A frame is speech when its RMS is within threshold_db of loud speech
+    (the 99th percentile frame) and above floor_dbfs, so a window holding
+    only a pause or room noise has no speech at all. Gaps shorter than
+    min_silence are kept.
+    """
+    size = int(frame * SAMPLE_RATE)
+    n_frames = len(audio) // size
+    if n_frames == 0:
+        return []
+    rms = np.sqrt(np.mean(audio[:n_frames * size].reshape(n_frames, size) ** 2, axis=1)) + 1e-10
+    level = 20 * np.log10(rms)  # dBFS: samples are in [-1, 1]
+    voiced = np.flatnonzero((level - np.percentile(level, 99) > threshold_db) & (level > floor_dbfs))
+    if len(voiced) == 0:
+        return []
+    gaps = np.flatnonzero(np.diff(voiced) > min_silence / frame)
+    starts = voiced[np.r_[0, gaps + 1]]
+    ends = voiced[np.r_[gaps, len(voiced) - 1]] + 1
+    duration = len(audio) / SAMPLE_RATE
+    regions = []
+    for start, end in zip(starts, ends):
+        regions += [round(max(0.0, float(start) * frame - pad), 2), round(min(duration, float(end) * frame + pad), 2)]
+    return regions
+
+def json_path(audio_file):
+    return f"jsons/{audio_file}.json"
+
+def hidden(path, suffix):
+    # Work files are hidden, so nothing downstream mistakes them for output
+    return os.path.join(os.path.dirname(path), "." + os.path.basename(path) + suffix)
+
+def superseded(audio_file, names):
+    """A legacy MP3 from before 01video_to_mp3.py wrote WAV, once its WAV exists."""
+    stem, ext = os.path.splitext(audio_file)
+    return ext == ".mp3" and stem + ".wav" in names
+
+def up_to_date(audio_file):
+    out = json_path(audio_file)
+    return os.path.exists(out) and os.path.getmtime(out) >= os.path.getmtime(f"audio/{audio_file}")
+
+def load_window(path, start, seconds):
+    """Decode ``seconds`` of audio from ``start`` (16 kHz mono float32)."""
+    if not seconds:
+        return whisper.load_audio(path)
+    cmd = ["ffmpeg", "-nostdin", "-threads", "0", "-ss", str(start), "-t", str(seconds), "-i", path,
+           "-f", "s16le", "-ac", "1", "-acodec", "pcm_s16le", "-ar", str(SAMPLE_RATE), "-"]
+    out = subprocess.run(cmd, capture_output=True, check=True).stdout
+    return np.frombuffer(out, np.int16).astype(np.float32) / 32768.0
+
+def read_checkpoint(part):
+    """(end of the last saved segment, its text); drops a torn last line."""
+    last_end, last_text, good = 0.0, "", 0
+    if os.path.exists(part):
+        with open(part, "rb") as f:
+            for line in f:
+                try:
+                    chunk = json.loads(line)
+                except json.JSONDecodeError:
+                    break
+                last_end, last_text = chunk["end"], chunk["text"]
+                good += len(line)
+        os.truncate(part, good)
+    return last_end, last_text
+
+def finish_json(part, out):
+    """Stream the checkpoint lines into the usual {"chunks", "text"} JSON."""
+    tmp = hidden(out, ".part")
+    with open(tmp, "w") as dst:
+        dst.write('{"chunks": [')
+        with open(part) as src:
+            for i, line in enumerate(src):
+                dst.write((", " if i else "") + line.strip())
+        dst.write('], "text": "')
+        with open(part) as src:
+            for line in src:
+                dst.write(json.dumps(json.loads(line)["text"])[1:-1])
+        dst.write('"}')
+    os.replace(tmp, out)
+    os.remove(part)
+
+def transcribe_file(audio_file):
+    """Transcribe window by window, appending segments to a checkpoint.
+
+    Windows of WINDOW seconds are decoded with OVERLAP extra seconds, so
+    speech cut at a boundary is heard whole. Window i keeps segments that
+    start inside it; a segment the previous window already covered
+    (midpoint before the last saved end) is dropped. Timestamps are moved
+    to the lecture's timeline, and an interrupted run resumes from the
+    last saved segment.
+    """
+    number=audio_file.split("_")[0]
+    name=audio_file.split("_")[1]
+    path, out = f"audio/{audio_file}", json_path(audio_file)
+    part = hidden(out, ".ndjson")
+    started = time.perf_counter()
+    last_end, last_text = read_checkpoint(part)
+
+    start = (last_end // WINDOW) * WINDOW if WINDOW else 0.0
+    duration, speech = start, 0.0
+    with open(part, "a") as checkpoint:
+        while True:
+            length = WINDOW + OVERLAP if WINDOW else None
+            audio = load_window(path, start, length)
+            if len(audio) == 0:
+                break
+            window_seconds = len(audio) / SAMPLE_RATE
+            last_window = not WINDOW or window_seconds < WINDOW + OVERLAP
+            # Seconds this window owns; the overlap is counted by the next one
+            owned = window_seconds if last_window else WINDOW
+            duration = start + window_seconds
+
+            options = {}
+            window_speech = owned
+            if VAD:
+                regions = speech_regions(audio)
+                if regions:
+                    options["clip_timestamps"] = regions
+                window_speech = sum(min(end, owned) - min(begin, owned) for begin, end in zip(regions[::2], regions[1::2]))
+            speech += window_speech
+
+            if options or not VAD:
+                result=model.transcribe(audio=audio,
+                                        language="ur",
+                                        task="translate",
+                                        word_timestamps=False,
+                                        initial_prompt=last_text or None,
+                                        **options)
+                for segment in result["segments"]:
+                    seg_start, seg_end = start + segment["start"], start + segment["end"]
+                    if WINDOW and seg_start >= start + WINDOW:
+                        continue  # the next window hears it with full context
+                    if (seg_start + seg_end) / 2 < last_end:
+                        continue  # already saved from the previous window
+                    chunk = {"number":number,
+                             "name":name,
+                             "start":round(seg_start, 2),
+                             "end":round(seg_end, 2),
+                             "text":segment["text"]}
+                    checkpoint.write(json.dumps(chunk) + "\n")
+                    last_end, last_text = seg_end, segment["text"]
+                checkpoint.flush()
+
+            if last_window:
+                break
+            start += WINDOW
+
+    finish_json(part, out)
+    return duration, speech, time.perf_counter() - started
+
+if __name__ == "__main__":
+    os.makedirs("jsons", exist_ok=True)
+    names = set(os.listdir("audio"))
+    audios = sorted(a for a in names if "_" in a and not a.startswith(".") and not superseded(a, names))
+    todo = [a for a in audios if not up_to_date(a)]
+    print(f"{len(audios) - len(todo)} already transcribed, {len(todo)} to do "
+          f"({WORKERS} workers x {THREADS} threads, VAD {'on' if VAD else 'off'})")
+
+    if todo:
+        with ProcessPoolExecutor(max_workers=min(WORKERS, len(todo)),
+                                 initializer=init_worker, initargs=(THREADS,)) as pool:
+            futures = {pool.submit(transcribe_file, a): a for a in todo}
+            for future in as_completed(futures):
+                try:
+                    duration, speech, seconds = future.result()
+                except Exception as e:
+                    # The checkpoint keeps what was done; the next run resumes it
+                    print(f"❌ {futures[future]}: {type(e).__name__}: {e}")
+                    continue
+                print(f"✅ {futures[future]}: {duration / 60:.1f} min audio, "
+                      f"{speech / 60:.1f} min speech, {seconds:.0f}s ({duration / seconds:.1f}x realtime)")
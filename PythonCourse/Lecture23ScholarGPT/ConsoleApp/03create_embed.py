@@ -1,49 +1,146 @@
 import requests
 import os
-import json 
-import pandas as pd
+import json
+import time
 import joblib
-
-def create_embedding(text_list):
-    r=requests.post("http://localhost:11434/api/embed",json={
-        "model":"bge-m3",
-        "input":text_list
-
-    })
-    embed= r.json()["embeddings"]
-    return embed
-
-
-
-jsons=os.listdir("jsons")
-my_dict=[]
-chunks_id=0
-# outer loop
-for json_file in jsons:
-    with open(f"jsons/{json_file}") as f:
-        contents=json.load(f)
-    print("for creating embeds")
-    embeddings=create_embedding([c["text"] for c in contents["chunks"]])
-    for i , chunk in enumerate(contents["chunks"]):
-        chunk["chunks_id"]=chunks_id
-        chunk["chunks_embeddings"]=embeddings[i]
-
-        chunks_id+=1
-
-        my_dict.append(chunk)
-print(my_dict)
-
-
-# a= create_embedding(["sat", "cat"])
-
-# print(a)
-
-
-df= pd.DataFrame.from_records(my_dict)
-print(df)
-
-
-joblib.dump(df, "embeddings.joblib")
-
-
-
+import numpy as np
+import pyarrow as pa
+import pyarrow.parquet as pq
+from collections import deque
+from concurrent.futures import ThreadPoolExecutor
+from requests.adapters import HTTPAdapter
+from urllib3.util.retry import Retry
+
+# Segments go to Ollama in fixed batches of BATCH, with up to CONCURRENCY
+# requests in flight over one keep-alive session
+OLLAMA_URL = os.getenv("OLLAMA_URL", "http://localhost:11434").rstrip("/")
+MODEL = os.getenv("EMBED_MODEL", "bge-m3")
+BATCH = int(os.getenv("EMBED_BATCH", "64"))
+CONCURRENCY = int(os.getenv("EMBED_CONCURRENCY", "4"))
+# One Parquet part per lecture JSON is the checkpoint: a finished file is
+# never embedded again, and a failure only loses the file it happened in.
+# Each part records MODEL, so parts from another model count as stale
+PARTS_DIR = "embeddings_parts"
+COLUMNS = ["number", "name", "start", "end", "text"]
+
+def make_session():
+    session = requests.Session()
+    retry = Retry(total=5, backoff_factor=1, status_forcelist=[429, 500, 502, 503, 504], allowed_methods=None)
+    adapter = HTTPAdapter(pool_connections=1, pool_maxsize=CONCURRENCY, max_retries=retry)
+    session.mount("http://", adapter)
+    session.mount("https://", adapter)
+    return session
+
+def create_embedding(session, text_list):
+    r = session.post(f"{OLLAMA_URL}/api/embed", json={
+        "model": MODEL,
+        "input": text_list
+    }, timeout=300)
+    r.raise_for_status()
+    body = r.json()
+    # Ollama reports some failures (e.g. an unknown model) in the body
+    if len(body.get("embeddings") or []) != len(text_list):
+        raise ValueError(f"Ollama returned no embeddings: {body.get('error', body)}")
+    return np.asarray(body["embeddings"], dtype=np.float32)
+
+def superseded(json_file, names):
+    """A legacy MP3 transcript, once the WAV of the same lecture is transcribed."""
+    stem, ext = os.path.splitext(json_file[:-len(".json")])
+    return ext == ".mp3" and stem + ".wav.json" in names
+
+def part_path(json_file):
+    return f"{PARTS_DIR}/{json_file}.parquet"
+
+def part_model(part):
+    metadata = pq.read_schema(part).metadata or {}
+    return metadata.get(b"embed_model", b"").decode()
+
+def up_to_date(json_file):
+    part = part_path(json_file)
+    return (os.path.exists(part) and os.path.getmtime(part) >= os.path.getmtime(f"jsons/{json_file}")
+            and part_model(part) == MODEL)
+
+def write_part(json_file, chunks, futures):
+    """Wait for a file's batches and write them as one Parquet part.
+
+    A file without segments gets an empty part, so it counts as done.
+    """
+    if chunks:
+        embeddings = np.vstack([future.result() for future in futures])
+        table = pa.table({
+            **{column: [chunk[column] for chunk in chunks] for column in COLUMNS},
+            "chunks_embeddings": pa.FixedSizeListArray.from_arrays(pa.array(embeddings.ravel()), embeddings.shape[1]),
+        })
+    else:
+        table = pa.table({column: pa.array([], pa.string()) for column in COLUMNS})
+    table = table.replace_schema_metadata({"embed_model": MODEL})
+    part = part_path(json_file)
+    tmp = f"{PARTS_DIR}/.{json_file}.parquet.part"
+    pq.write_table(table, tmp)
+    os.replace(tmp, part)
+
+def assemble(json_files):
+    """embeddings.joblib from the parts, in the DataFrame shape core/pipeline.py loads.
+
+    Parts left from another model (their file failed this run) are skipped,
+    so vectors of different models are never mixed.
+    """
+    parts = [part_path(j) for j in json_files
+             if os.path.exists(part_path(j)) and pq.read_metadata(part_path(j)).num_rows
+             and part_model(part_path(j)) == MODEL]
+    if not parts:
+        return None
+    df = pa.concat_tables([pq.read_table(p) for p in parts]).to_pandas()
+    df.insert(len(COLUMNS), "chunks_id", np.arange(len(df)))
+    joblib.dump(df, ".embeddings.joblib.part")
+    os.replace(".embeddings.joblib.part", "embeddings.joblib")
+    return df
+
+if __name__ == "__main__":
+    os.makedirs(PARTS_DIR, exist_ok=True)
+    # Hidden files in jsons/ are 02speech_to_text.py work in progress
+    names = set(os.listdir("jsons"))
+    jsons = sorted(j for j in names if j.endswith(".json") and not j.startswith(".")
+                   and not superseded(j, names))
+    todo = [j for j in jsons if not up_to_date(j)]
+    print(f"{len(jsons) - len(todo)} already embedded, {len(todo)} to do "
+          f"(batches of {BATCH}, {CONCURRENCY} in flight)")
+
+    started = time.perf_counter()
+    segments = failed = 0
+    session = make_session()
+    with ThreadPoolExecutor(max_workers=CONCURRENCY) as pool:
+        # Files whose batches are queued; the oldest is written once the
+        # queue holds more than enough batches to keep every slot busy
+        pending = deque()
+
+        def finish_oldest():
+            global segments, failed
+            json_file, chunks, futures = pending.popleft()
+            try:
+                write_part(json_file, chunks, futures)
+            except (requests.RequestException, ValueError) as e:
+                failed += 1
+                print(f"❌ {json_file}: {e}")
+                return
+            segments += len(chunks)
+            print(f"✅ {json_file}: {len(chunks)} segments")
+
+        for json_file in todo:
+            with open(f"jsons/{json_file}") as f:
+                chunks = json.load(f)["chunks"]
+            texts = [c["text"] for c in chunks]
+            futures = [pool.submit(create_embedding, session, texts[i:i + BATCH])
+                       for i in range(0, len(texts), BATCH)]
+            pending.append((json_file, chunks, futures))
+            while sum(len(p[2]) for p in pending) > 2 * CONCURRENCY:
+                finish_oldest()
+        while pending:
+            finish_oldest()
+
+    elapsed = time.perf_counter() - started
+    if todo:
+        print(f"Embedded {segments} segments in {elapsed:.1f}s ({segments / elapsed:.0f}/s), {failed} files failed")
+
+    df = assemble(jsons)
+    print(df)
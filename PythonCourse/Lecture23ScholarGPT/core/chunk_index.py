@@ -0,0 +1,72 @@
+# core/chunk_index.py
+"""
+ScholarGPT - Chunk Retrieval Index
+Description:
+    The lecture chunk embeddings, stacked once at startup into one
+    contiguous float32 matrix with L2-normalised rows. Cosine similarity
+    to a question is then a single matrix-vector product, and the top k
+    come from argpartition instead of sorting every chunk.
+
+    CHUNK_INDEX picks the search:
+      * exact  -- the matrix product above
+      * hnsw   -- an approximate hnswlib graph (pip install hnswlib)
+      * auto   -- hnsw once there are CHUNK_ANN_MIN_ROWS chunks and
+                  hnswlib is installed, exact otherwise (default)
+"""
+
+import os
+
+import numpy as np
+
+try:
+    import hnswlib
+except ImportError:
+    hnswlib = None
+
+
+def normalize_rows(matrix):
+    norms = np.linalg.norm(matrix, axis=-1, keepdims=True)
+    return matrix / np.maximum(norms, 1e-12)
+
+
+class ChunkIndex:
+    def __init__(self, embeddings, backend="auto", ann_min_rows=50_000, ef=64):
+        self.matrix = np.ascontiguousarray(normalize_rows(np.vstack(embeddings).astype(np.float32)))
+        self.graph = None
+        if backend == "auto":
+            backend = "hnsw" if hnswlib is not None and len(self.matrix) >= ann_min_rows else "exact"
+        if backend == "hnsw":
+            if hnswlib is None:
+                raise RuntimeError("CHUNK_INDEX=hnsw needs `pip install hnswlib`")
+            self.graph = hnswlib.Index(space="ip", dim=self.matrix.shape[1])
+            self.graph.init_index(max_elements=len(self.matrix), ef_construction=200, M=16)
+            self.graph.add_items(self.matrix, np.arange(len(self.matrix)))
+            self.graph.set_ef(ef)
+        elif backend != "exact":
+            raise ValueError(f"Unknown CHUNK_INDEX {backend!r} (choose from exact, hnsw, auto)")
+        self.backend = backend
+
+    @classmethod
+    def from_env(cls, embeddings):
+        return cls(
+            embeddings,
+            backend=os.getenv("CHUNK_INDEX", "auto"),
+            ann_min_rows=int(os.getenv("CHUNK_ANN_MIN_ROWS", "50000")),
+            ef=int(os.getenv("CHUNK_ANN_EF", "64")),
+        )
+
+    def __len__(self):
+        return len(self.matrix)
+
+    def search(self, query_embedding, k=5):
+        """Row positions of the k most similar chunks, best first."""
+        query = normalize_rows(np.asarray(query_embedding, dtype=np.float32))
+        k = min(k, len(self.matrix))
+        if k == 0:
+            return np.empty(0, dtype=np.int64)
+        if self.graph is not None:
+            labels, _ = self.graph.knn_query(query, k=k)
+            return labels[0].astype(np.int64)
+        scores = self.matrix @ query
+        top = np.argpartition(-scores, k - 1)[:k]
+        return top[np.argsort(-scores[top])]
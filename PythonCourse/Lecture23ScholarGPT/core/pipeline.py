@@ -4,22 +4,33 @@ import whisper
 import json
 import pandas as pd
 import joblib
-import numpy as np
 import requests
-from sklearn.metrics.pairwise import cosine_similarity
+from core.chunk_index import ChunkIndex
+from core.query_cache import QueryEmbeddingCache
 
 
 
 
 model = whisper.load_model("base")
 df = joblib.load("embeddings.joblib")
+# Stacked and normalised once here, not on every question
+chunk_index = ChunkIndex.from_env(df["chunks_embeddings"])
+
+query_cache = QueryEmbeddingCache.from_env("bge-m3")
 
 def create_embedding(text_list):
-    r = requests.post("http://localhost:11434/api/embed", json={
-        "model": "bge-m3",
-        "input": text_list
-    })
-    return r.json()["embeddings"]
+    # Only texts missing from the cache go to Ollama, in one request
+    results = {text: query_cache.get(text) for text in text_list}
+    missing = [text for text, vectors in results.items() if vectors is None]
+    if missing:
+        r = requests.post("http://localhost:11434/api/embed", json={
+            "model": "bge-m3",
+            "input": missing
+        })
+        for text, embedding in zip(missing, r.json()["embeddings"]):
+            results[text] = [embedding]
+            query_cache.put(text, [embedding])
+    return [results[text][0] for text in text_list]
 
 def inference(prompt):
     r = requests.post("http://localhost:11434/api/generate", json={
@@ -33,14 +44,9 @@ def inference(prompt):
 def run_chatbot(question):
     question_embedding = create_embedding([question])[0]
 
-    similarities = cosine_similarity(
-        np.vstack(df["chunks_embeddings"]),
-        [question_embedding]
-    ).flatten()
-
     top_results = 5
-    max_indx = similarities.argsort()[::-1][0:top_results]
-    new_df = df.loc[max_indx]
+    max_indx = chunk_index.search(question_embedding, top_results)
+    new_df = df.iloc[max_indx]
 
     # prompt = f"""
     # Nouman Ali Khan lecture QA bot 
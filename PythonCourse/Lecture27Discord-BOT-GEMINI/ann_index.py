@@ -0,0 +1,395 @@
+# ann_index.py
+"""
+SMASB BOT - Approximate Nearest-Neighbour Index
+Description:
+    Candidate generation for large post corpora. The ANN index only
+    proposes chunk rows; VectorIndex re-scores them exactly, so results
+    are always real cosine scores.
+
+    Backends:
+      * IVFIndex       - pure NumPy inverted file (spherical k-means lists)
+      * HNSWIndex      - hnswlib graph, used when the library is installed
+      * QuantizedIndex - every row scored on a memory-mapped int8 (per-row
+                         scale) or float16 copy. With its error bound it
+                         also serves exact search: only rows that could
+                         still make the result are re-scored from the
+                         float32 matrix, which otherwise stays on disk
+
+    Tuning knobs (recall vs latency):
+      IVF  : n_lists (coarse clusters), n_probe (lists scanned per query)
+      HNSW : m, ef_construction (build quality), ef (search breadth)
+      int8 / float16 : n_candidates (rows re-scored before the bound check;
+                       approximate search re-scores only these)
+
+    The bots, the API and publish_index.py take them from ANN_N_PROBE,
+    ANN_EF, ANN_M and ANN_CANDIDATES (see ann_params); unset ones keep
+    the defaults below.
+"""
+
+import os
+import numpy as np
+
+try:
+    import hnswlib
+except ImportError:
+    hnswlib = None
+
+
+ANN_BACKENDS = ("ivf", "hnsw", "int8", "float16")
+
+# Approximate search is opt-in: SEARCH_MODE=approx (the bots) or an explicit
+# ANN_BACKEND (auto | ivf | hnsw | int8 | float16 | none). Otherwise no ANN
+# index is built or loaded, and every search is exact.
+EXACT_SEARCH = os.getenv("SEARCH_MODE", "exact") != "approx"
+ANN_BACKEND = os.getenv("ANN_BACKEND") or ("none" if EXACT_SEARCH else "auto")
+# Chunk rows re-scored per query chunk (VectorIndex n_candidates)
+ANN_CANDIDATES = int(os.getenv("ANN_CANDIDATES", "64"))
+# Index parameters each backend reads from the environment; ANN_M only
+# applies when the HNSW graph is built
+ANN_PARAM_ENV = {
+    "ivf": {"n_probe": "ANN_N_PROBE"},
+    "hnsw": {"m": "ANN_M", "ef": "ANN_EF"},
+}
+
+
+def ann_path(store_file, backend):
+    """ANN files live next to the embedding store, e.g. embeddings.ivf.npz."""
+    base = os.path.join(os.path.dirname(store_file), os.path.basename(store_file).split(".")[0])
+    if backend == "hnsw":
+        return f"{base}.hnsw.bin"
+    if backend in ("int8", "float16"):
+        return f"{base}.{backend}.npy"  # codes; scales beside it (QuantizedIndex)
+    return f"{base}.{backend}.npz"
+
+
+def ann_files(store_file, backend):
+    """Every file a backend writes, for removal when the store is rewritten."""
+    path = ann_path(store_file, backend)
+    return [path, QuantizedIndex.scales_path(path)] if backend in ("int8", "float16") else [path]
+
+
+# =====================================================
+# IVF (pure NumPy)
+# =====================================================
+class IVFIndex:
+    backend = "ivf"
+
+    def __init__(self, n_lists=None, n_probe=8, n_iter=10, seed=0):
+        self.n_lists = n_lists
+        self.n_probe = n_probe
+        self.n_iter = n_iter
+        self.seed = seed
+        self.centroids = None
+        self.list_rows = []
+        self.n_rows = 0
+
+    def _assign(self, vectors, batch=65536):
+        labels = np.empty(len(vectors), dtype=np.int32)
+        for start in range(0, len(vectors), batch):
+            block = vectors[start:start + batch]
+            labels[start:start + batch] = np.argmax(block @ self.centroids.T, axis=1)
+        return labels
+
+    def _train(self, matrix):
+        rng = np.random.default_rng(self.seed)
+        n_lists = self.n_lists or max(1, int(np.sqrt(len(matrix))))
+        n_lists = min(n_lists, len(matrix))
+        sample_size = min(len(matrix), n_lists * 256)
+        sample = matrix[rng.choice(len(matrix), sample_size, replace=False)]
+        self.centroids = sample[rng.choice(len(sample), n_lists, replace=False)].copy()
+
+        for _ in range(self.n_iter):
+            labels = self._assign(sample)
+            sums = np.zeros_like(self.centroids)
+            np.add.at(sums, labels, sample)
+            counts = np.bincount(labels, minlength=n_lists)
+            empty = counts == 0
+            # Re-seed empty lists with random sample rows
+            sums[empty] = sample[rng.choice(len(sample), int(empty.sum()))]
+            norms = np.linalg.norm(sums, axis=1, keepdims=True)
+            norms[norms == 0] = 1.0
+            self.centroids = (sums / norms).astype(np.float32)
+
+    def build(self, matrix):
+        self._train(matrix)
+        self.list_rows = [np.zeros(0, dtype=np.int64) for _ in range(len(self.centroids))]
+        self.n_rows = 0
+        self.add(matrix)
+        return self
+
+    def add(self, matrix):
+        """Assign rows ``n_rows..len(matrix)`` to their nearest list."""
+        new_rows = np.arange(self.n_rows, len(matrix), dtype=np.int64)
+        if len(new_rows) == 0:
+            return self
+        labels = self._assign(matrix[self.n_rows:])
+        order = np.argsort(labels, kind="stable")
+        bounds = np.searchsorted(labels[order], np.arange(len(self.centroids) + 1))
+        for lst in range(len(self.centroids)):
+            rows = new_rows[order[bounds[lst]:bounds[lst + 1]]]
+            if len(rows):
+                self.list_rows[lst] = np.concatenate([self.list_rows[lst], rows])
+        self.n_rows = len(matrix)
+        return self
+
+    def candidates(self, queries, k):
+        n_probe = min(self.n_probe, len(self.centroids))
+        probes = np.argpartition(-(queries @ self.centroids.T), n_probe - 1, axis=1)[:, :n_probe]
+        lists = np.unique(probes)
+        return np.concatenate([self.list_rows[lst] for lst in lists])
+
+    def save(self, path):
+        sizes = np.array([len(rows) for rows in self.list_rows], dtype=np.int64)
+        tmp_path = f"{path}.{os.getpid()}.tmp.npz"  # per process, see embedding_store.temp_path
+        np.savez(
+            tmp_path,
+            centroids=self.centroids,
+            list_sizes=sizes,
+            list_rows=np.concatenate(self.list_rows) if self.list_rows else np.zeros(0, np.int64),
+            params=np.array([self.n_probe, self.n_iter, self.seed, self.n_rows], dtype=np.int64),
+        )
+        os.replace(tmp_path, path)
+
+    @classmethod
+    def load(cls, path):
+        data = np.load(path)
+        n_probe, n_iter, seed, n_rows = (int(v) for v in data["params"])
+        index = cls(n_lists=len(data["centroids"]), n_probe=n_probe, n_iter=n_iter, seed=seed)
+        index.centroids = data["centroids"]
+        index.list_rows = np.split(data["list_rows"], np.cumsum(data["list_sizes"])[:-1])
+        index.n_rows = n_rows
+        return index
+
+
+# =====================================================
+# HNSW (optional, hnswlib)
+# =====================================================
+class HNSWIndex:
+    backend = "hnsw"
+
+    def __init__(self, m=16, ef_construction=200, ef=64):
+        if hnswlib is None:
+            raise RuntimeError("hnswlib is not installed")
+        self.m = m
+        self.ef_construction = ef_construction
+        self.ef = ef
+        self.graph = None
+
+    @property
+    def n_rows(self):
+        return self.graph.get_current_count() if self.graph is not None else 0
+
+    def build(self, matrix):
+        self.graph = hnswlib.Index(space="ip", dim=matrix.shape[1])
+        self.graph.init_index(max_elements=len(matrix), ef_construction=self.ef_construction, M=self.m)
+        self.graph.add_items(matrix, np.arange(len(matrix)))
+        return self
+
+    def add(self, matrix):
+        start = self.n_rows
+        if start == len(matrix):
+            return self
+        self.graph.resize_index(len(matrix))
+        self.graph.add_items(matrix[start:], np.arange(start, len(matrix)))
+        return self
+
+    def candidates(self, queries, k):
+        k = min(k, self.n_rows)
+        self.graph.set_ef(max(self.ef, k))
+        labels, _ = self.graph.knn_query(queries, k=k)
+        return np.unique(labels).astype(np.int64)
+
+    def save(self, path):
+        tmp_path = f"{path}.{os.getpid()}.tmp"
+        self.graph.save_index(tmp_path)
+        os.replace(tmp_path, path)
+
+    @classmethod
+    def load(cls, path, dim, **params):
+        index = cls(**params)
+        index.graph = hnswlib.Index(space="ip", dim=dim)
+        index.graph.load_index(path)
+        return index
+
+
+# =====================================================
+# Scalar Quantisation (int8 / float16, pure NumPy)
+# =====================================================
+class QuantizedIndex:
+    """A compact copy of the matrix that replaces the float32 scan.
+
+    int8 keeps one float32 scale per row (max |value| / 127), so each row
+    uses its full code range; float16 needs no scale. At 1536 dims a
+    chunk takes 1.5 KB (int8) or 3 KB (float16) instead of 6 KB.
+
+    Codes and scales are plain .npy files opened with mmap_mode="r", so
+    every worker shares them through the page cache like the store. Each
+    row's quantisation error is bounded (error_bounds), which lets
+    VectorIndex answer exact searches from the codes, reading float32
+    rows only to re-score those that could still be in the result.
+
+    NumPy has no int8/float16 matrix product, so codes are widened to
+    float32 in cache-sized blocks before scoring. int8 widens about as
+    fast as the float32 scan runs; float16 widening is several times
+    slower, so int8 is the one to use for speed.
+    """
+
+    # float16 keeps 11 significant bits: |q.(x - x16)| <= 2^-11 |q| |x|
+    FLOAT16_BOUND = 2.0 ** -11
+    # float32 accumulation over a block, far below either bound
+    SLACK = 1e-5
+
+    def __init__(self, dtype="int8", block=256):
+        if dtype not in ("int8", "float16"):
+            raise ValueError("dtype must be int8 or float16")
+        self.backend = dtype
+        self.block = block
+        self.codes = None
+        self.scales = None
+
+    @property
+    def n_rows(self):
+        return 0 if self.codes is None else len(self.codes)
+
+    def quantize(self, rows):
+        rows = np.asarray(rows, dtype=np.float32)
+        if self.backend == "float16":
+            return rows.astype(np.float16), np.ones(len(rows), dtype=np.float32)
+        scales = np.abs(rows).max(axis=1) / 127
+        scales[scales == 0] = 1.0
+        codes = np.rint(rows / scales[:, None]).astype(np.int8)
+        return codes, scales.astype(np.float32)
+
+    def build(self, matrix):
+        self.codes, self.scales = None, None
+        return self.add(matrix)
+
+    def add(self, matrix):
+        """Quantise rows ``n_rows..len(matrix)`` (rows are independent)."""
+        parts = [] if self.codes is None else [(self.codes, self.scales)]
+        for start in range(self.n_rows, len(matrix), self.block):
+            parts.append(self.quantize(matrix[start:start + self.block]))
+        if parts:
+            self.codes = np.concatenate([codes for codes, _ in parts])
+            self.scales = np.concatenate([scales for _, scales in parts])
+        return self
+
+    def coarse_scores(self, queries):
+        """Per-row score (best over the query rows) from the codes."""
+        scores = np.empty(self.n_rows, dtype=np.float32)
+        for start in range(0, self.n_rows, self.block):
+            block = self.codes[start:start + self.block].astype(np.float32)
+            scores[start:start + self.block] = (block @ queries.T).max(axis=1)
+        return scores * self.scales
+
+    def error_bounds(self, queries):
+        """Per-row bound on |exact score - coarse score| for these queries."""
+        if self.backend == "float16":
+            return np.full(self.n_rows, self.FLOAT16_BOUND + self.SLACK, dtype=np.float32)
+        # Every code is within scale / 2 of its value: |q.err| <= scale / 2 * |q|_1
+        return self.scales * (np.abs(queries).sum(axis=1).max() / 2) + self.SLACK
+
+    def candidates(self, queries, k):
+        scores = self.coarse_scores(queries)
+        if k >= len(scores):
+            return np.arange(len(scores), dtype=np.int64)
+        return np.sort(np.argpartition(-scores, k - 1)[:k]).astype(np.int64)
+
+    @staticmethod
+    def scales_path(path):
+        return path[:-len(".npy")] + ".scales.npy"
+
+    def save(self, path):
+        # Scales first: a reader only trusts them when the codes match in length
+        for target, array in ((self.scales_path(path), self.scales), (path, self.codes)):
+            tmp_path = f"{target}.{os.getpid()}.tmp.npy"
+            np.save(tmp_path, array)
+            os.replace(tmp_path, target)
+        # Serve from the shared mapping from now on, not the private copy
+        self.codes = np.load(path, mmap_mode="r")
+        self.scales = np.load(self.scales_path(path), mmap_mode="r")
+
+    @classmethod
+    def load(cls, path):
+        codes = np.load(path, mmap_mode="r")
+        scales = np.load(cls.scales_path(path), mmap_mode="r")
+        if len(scales) != len(codes):
+            return None  # caught between the two renames of a save
+        index = cls("float16" if codes.dtype == np.float16 else "int8")
+        index.codes, index.scales = codes, scales
+        return index
+
+
+# =====================================================
+# Loading & Incremental Rebuild
+# =====================================================
+def resolve_backend(backend="auto"):
+    if backend == "auto":
+        return "hnsw" if hnswlib is not None else "ivf"
+    return backend
+
+
+def ann_params(backend=ANN_BACKEND):
+    """``load_ann`` / ``load_or_build_ann`` keyword arguments set in the environment."""
+    names = ANN_PARAM_ENV.get(resolve_backend(backend), {})
+    return {param: int(os.environ[var]) for param, var in names.items() if os.getenv(var)}
+
+
+def _new_index(backend, params):
+    if backend in ("int8", "float16"):
+        return QuantizedIndex(backend, **params)
+    return IVFIndex(**params) if backend == "ivf" else HNSWIndex(**params)
+
+
+def _load_saved(path, backend, dim, params):
+    if not os.path.exists(path):
+        return None
+    if backend in ("int8", "float16"):
+        if not os.path.exists(QuantizedIndex.scales_path(path)):
+            return None
+        index = QuantizedIndex.load(path)
+        return index if index is not None and index.codes.shape[1] == dim else None
+    if backend == "ivf":
+        index = IVFIndex.load(path)
+        if index.centroids.shape[1] != dim:
+            return None  # built for another embedder's vectors
+        if params.get("n_probe"):
+            index.n_probe = params["n_probe"]
+        return index
+    try:
+        return HNSWIndex.load(path, dim, **params)
+    except RuntimeError:
+        return None  # hnswlib rejects a graph of another dimension
+
+
+def load_ann(matrix, store_file, backend="auto", **params):
+    """Read-only load: the saved index if it covers exactly ``matrix``, else None."""
+    backend = resolve_backend(backend)
+    if len(matrix) == 0:
+        return None
+    index = _load_saved(ann_path(store_file, backend), backend, matrix.shape[1], params)
+    return index if index is not None and index.n_rows == len(matrix) else None
+
+
+def load_or_build_ann(matrix, store_file, backend="auto", **params):
+    """Load the persisted ANN index, extend it with new rows, or build it.
+
+    Rows are only ever appended to the store, so an index that covers a
+    prefix of ``matrix`` is updated in place; anything else is rebuilt.
+    """
+    backend = resolve_backend(backend)
+    path = ann_path(store_file, backend)
+    if len(matrix) == 0:
+        return None
+
+    index = _load_saved(path, backend, matrix.shape[1], params)
+    if index is not None and index.n_rows > len(matrix):
+        index = None
+
+    if index is None:
+        index = _new_index(backend, params).build(matrix)
+        index.save(path)
+    elif index.n_rows < len(matrix):
+        index.add(matrix)
+        index.save(path)
+    return index
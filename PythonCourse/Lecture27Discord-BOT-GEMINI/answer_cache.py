@@ -0,0 +1,90 @@
+# answer_cache.py
+"""
+SMASB BOT - Semantic Answer Cache
+Description:
+    Skips the Gemini call when the same post was retrieved for a question
+    that means the same thing as one answered recently. Entries are keyed
+    on (retrieved post id, question embedding) -- the "post id" may be a
+    tuple of ids when several posts form the context; a lookup hits when
+    the cosine similarity to a cached question for that post reaches
+    ANSWER_CACHE_THRESHOLD. Entries are evicted least-recently-used
+    beyond ANSWER_CACHE_SIZE and expire after ANSWER_CACHE_TTL seconds.
+"""
+
+import itertools
+import os
+import threading
+import time
+from collections import OrderedDict
+
+import numpy as np
+
+from vector_index import normalize_rows
+
+
+def question_vector(query_embeddings):
+    """One unit vector per question (mean of its chunk embeddings)."""
+    return normalize_rows(normalize_rows(query_embeddings).mean(axis=0))[0]
+
+
+class SemanticAnswerCache:
+    def __init__(self, threshold=0.95, max_entries=512, max_age=3600):
+        self.threshold = threshold
+        self.max_entries = max_entries
+        self.max_age = max_age
+        self.lock = threading.Lock()
+        self.entries = OrderedDict()  # entry id -> (post id, vector, answer, created)
+        self.by_post = {}             # post id -> set of entry ids
+        self.ids = itertools.count()
+        self.hits = self.misses = 0
+
+    @classmethod
+    def from_env(cls):
+        return cls(
+            threshold=float(os.getenv("ANSWER_CACHE_THRESHOLD", "0.95")),
+            max_entries=int(os.getenv("ANSWER_CACHE_SIZE", "512")),
+            max_age=float(os.getenv("ANSWER_CACHE_TTL", "3600")),
+        )
+
+    def _drop(self, entry_id):
+        post_id = self.entries.pop(entry_id)[0]
+        self.by_post[post_id].discard(entry_id)
+        if not self.by_post[post_id]:
+            del self.by_post[post_id]
+
+    def lookup(self, post_id, query_embeddings):
+        if len(query_embeddings) == 0:
+            return None
+        vector, now = question_vector(query_embeddings), time.time()
+        with self.lock:
+            for entry_id in [e for e in self.by_post.get(post_id, ()) if now - self.entries[e][3] > self.max_age]:
+                self._drop(entry_id)
+            candidates = list(self.by_post.get(post_id, ()))
+            if candidates:
+                scores = np.stack([self.entries[e][1] for e in candidates]) @ vector
+                best = int(np.argmax(scores))
+                if scores[best] >= self.threshold:
+                    self.entries.move_to_end(candidates[best])
+                    self.hits += 1
+                    return self.entries[candidates[best]][2]
+            self.misses += 1
+            return None
+
+    def store(self, post_id, query_embeddings, answer):
+        if len(query_embeddings) == 0:
+            return
+        with self.lock:
+            entry_id = next(self.ids)
+            self.entries[entry_id] = (post_id, question_vector(query_embeddings), answer, time.time())
+            self.by_post.setdefault(post_id, set()).add(entry_id)
+            while len(self.entries) > self.max_entries:
+                self._drop(next(iter(self.entries)))
+
+    def stats(self):
+        lookups = self.hits + self.misses
+        return {
+            "hits": self.hits,
+            "misses": self.misses,
+            "hit_rate": self.hits / lookups if lookups else 0.0,
+            "size": len(self.entries),
+        }
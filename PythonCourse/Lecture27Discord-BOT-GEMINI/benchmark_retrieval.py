@@ -0,0 +1,306 @@
+# benchmark_retrieval.py
+"""
+SMASB BOT - Retrieval Benchmark
+Description:
+    Measures speed and accuracy of every retrieval backend on the same
+    queries and prints the results as JSON (or writes them with --out),
+    so runs can be compared across commits.
+
+    Per backend: build time and memory, p50/p95/p99 latency, QPS, and
+    recall@k against exact search (posts tied with the k-th exact score
+    all count as hits). Backends: exact, ivf, hnsw (if installed),
+    int8 / float16 (quantised scan, exact thanks to its error bound) and
+    their -approx variants, bm25, hybrid.
+
+    Corpora (all run offline, no API calls):
+      * synthetic  -- --posts N topic-clustered posts (default)
+      * posts      -- facebook_posts.json, embedded with the fake embedder
+      * store      -- the real vectors (embeddings.meta.json, or
+                      embeddings.joblib); queries are noisy copies of
+                      stored rows
+
+    The fake embedder hashes each word to a fixed random vector and sums
+    them, so texts that share words get similar vectors and the lexical
+    and vector backends can be compared on equal terms.
+
+Usage:
+    python benchmark_retrieval.py --posts 20000 --queries 500 --out bench.json
+    python benchmark_retrieval.py --corpus store --k 5
+"""
+
+import argparse
+import hashlib
+import json
+import os
+import platform
+import resource
+import sys
+import time
+import tracemalloc
+
+import numpy as np
+
+from vector_index import VectorIndex, normalize_rows
+from ann_index import IVFIndex, HNSWIndex, QuantizedIndex, hnswlib
+from bm25_index import BM25Index, fuse_scores
+from chunking import split_sentences
+
+
+# =====================================================
+# Corpus & Fake Embedder
+# =====================================================
+class FakeEmbedder:
+    """Deterministic bag-of-words embedder: one random unit vector per word."""
+
+    def __init__(self, dim=256):
+        self.dim = dim
+        self.words = {}
+
+    def word_vector(self, word):
+        if word not in self.words:
+            seed = int.from_bytes(hashlib.blake2b(word.encode("utf-8"), digest_size=8).digest(), "little")
+            self.words[word] = np.random.default_rng(seed).standard_normal(self.dim).astype(np.float32)
+        return self.words[word]
+
+    def embed(self, texts):
+        vectors = np.zeros((len(texts), self.dim), dtype=np.float32)
+        for i, text in enumerate(texts):
+            for word in text.split():
+                vectors[i] += self.word_vector(word)
+        return normalize_rows(vectors)
+
+
+def synthetic_posts(n_posts, n_topics=50, words_per_topic=40, post_words=60, seed=0):
+    """Posts mixing topic words with shared filler words."""
+    rng = np.random.default_rng(seed)
+    filler = [f"w{i}" for i in range(2000)]
+    posts = []
+    for number in range(1, n_posts + 1):
+        topic = rng.integers(n_topics)
+        topic_words = [f"t{topic}_{j}" for j in rng.integers(words_per_topic, size=post_words // 2)]
+        words = topic_words + [filler[j] for j in rng.integers(len(filler), size=post_words // 2)]
+        rng.shuffle(words)
+        # Sentences of ~12 words so multi-chunk posts are exercised too
+        sentences = [" ".join(words[i:i + 12]) + "." for i in range(0, len(words), 12)]
+        posts.append({"post": number, "content": " ".join(sentences)})
+    return posts
+
+
+def embed_posts(posts, embedder, sentences_per_chunk=5):
+    items = []
+    for post in posts:
+        sentences = split_sentences(post["content"])
+        chunks = [" ".join(sentences[i:i + sentences_per_chunk]) for i in range(0, len(sentences), sentences_per_chunk)]
+        if chunks:
+            items.append({"post": post, "embeddings": embedder.embed(chunks)})
+    return VectorIndex.from_post_embeddings(items)
+
+
+def load_store_index():
+    from embedding_store import STORE_FILE, open_store
+    if os.path.exists(STORE_FILE):
+        return open_store(STORE_FILE)
+    import joblib
+    return VectorIndex.from_post_embeddings(joblib.load("embeddings.joblib"))
+
+
+def make_queries(index, n_queries, embedder=None, words=6, noise=0.05, seed=1):
+    """(text, vectors) pairs: a few words of a random post, embedded.
+
+    Without an embedder (real stored vectors) the query vector is a
+    stored chunk of that post plus Gaussian noise.
+    """
+    rng = np.random.default_rng(seed)
+    queries = []
+    for pos in rng.integers(len(index), size=n_queries):
+        post_words = index.posts[pos]["content"].split()
+        picked = [post_words[j] for j in rng.integers(len(post_words), size=min(words, len(post_words)))]
+        text = " ".join(picked)
+        if embedder is not None:
+            vectors = embedder.embed([text])
+        else:
+            row = index.matrix[index.offsets[pos]]
+            vectors = normalize_rows(row + noise * rng.standard_normal(index.dim).astype(np.float32))
+        queries.append((text, vectors))
+    return queries
+
+
+# =====================================================
+# Backends
+# =====================================================
+def post_ids(results):
+    return [post["post"] for post, _ in results]
+
+
+def build_backends(index, args, wanted=()):
+    """name -> (build seconds, build bytes, search(text, vectors) -> [post ids]).
+
+    Only backends in ``wanted`` are built, or all of them if it is empty.
+    """
+    backends = {}
+
+    def measure_build(name, build, search):
+        if wanted and name not in wanted:
+            return
+        tracemalloc.start()
+        started = time.perf_counter()
+        state = build()
+        seconds = time.perf_counter() - started
+        _, peak = tracemalloc.get_traced_memory()
+        tracemalloc.stop()
+        backends[name] = (seconds, peak, lambda text, vectors: search(state, text, vectors))
+
+    def exact_search(ann, text, vectors):
+        index.ann = ann
+        return post_ids(index.search(vectors, k=args.k, exact=True, n_candidates=args.candidates))
+
+    measure_build("exact", lambda: None, exact_search)
+
+    def ann_search(ann, text, vectors):
+        index.ann = ann
+        return post_ids(index.search(vectors, k=args.k, exact=False, n_candidates=args.candidates))
+
+    measure_build("ivf", lambda: IVFIndex(n_probe=args.n_probe).build(index.matrix), ann_search)
+    if hnswlib is not None:
+        measure_build("hnsw", lambda: HNSWIndex(ef=args.ef).build(index.matrix), ann_search)
+    # Two-phase: coarse scores on quantised rows, exact re-scoring of every
+    # row the error bound cannot rule out (exact search), or of the best only
+    for dtype in ("int8", "float16"):
+        measure_build(dtype, lambda dtype=dtype: QuantizedIndex(dtype).build(index.matrix), exact_search)
+        measure_build(f"{dtype}-approx", lambda dtype=dtype: QuantizedIndex(dtype).build(index.matrix), ann_search)
+
+    measure_build(
+        "bm25", lambda: BM25Index(index.posts),
+        lambda bm25, text, vectors: post_ids(bm25.search(text, k=args.k)),
+    )
+
+    def hybrid_search(bm25, text, vectors):
+        index.ann = None
+        fused = fuse_scores(index.post_scores(vectors), bm25.scores(text)[0], args.alpha)
+        top = np.argsort(-fused)[:args.k]
+        return [index.posts[i]["post"] for i in top]
+
+    measure_build("hybrid", lambda: BM25Index(index.posts), hybrid_search)
+    return backends
+
+
+# =====================================================
+# Measurement
+# =====================================================
+def exact_truth(index, queries, k, tol=1e-6):
+    """Per query: (post ids scoring at least the exact k-th best score, k).
+
+    Every post tied with the k-th score counts as a correct answer, since
+    exact search breaks ties arbitrarily and duplicate posts are common.
+    """
+    truth = []
+    for _, vectors in queries:
+        scores = index.post_scores(vectors)
+        n = min(k, int((scores > 0).sum()))
+        if n == 0:
+            truth.append((set(), 0))
+            continue
+        kth = -np.partition(-scores, n - 1)[n - 1]
+        truth.append(({index.posts[i]["post"] for i in np.flatnonzero(scores >= kth - tol)}, n))
+    return truth
+
+
+def run_backend(search, queries, truth, k, warmup=10):
+    for text, vectors in queries[:warmup]:
+        search(text, vectors)
+    latencies, recalls = [], []
+    started = time.perf_counter()
+    for (text, vectors), (accepted, n_expected) in zip(queries, truth):
+        t0 = time.perf_counter()
+        found = search(text, vectors)
+        latencies.append(time.perf_counter() - t0)
+        if n_expected:
+            recalls.append(len(set(found[:k]) & accepted) / n_expected)
+    total = time.perf_counter() - started
+    p50, p95, p99 = np.percentile(np.array(latencies) * 1000, [50, 95, 99])
+    return {
+        "p50_ms": round(float(p50), 3),
+        "p95_ms": round(float(p95), 3),
+        "p99_ms": round(float(p99), 3),
+        "qps": round(len(queries) / total, 1),
+        f"recall@{k}": round(float(np.mean(recalls)), 4) if recalls else None,
+    }
+
+
+def max_rss_mb():
+    rss = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    return round(rss / (1024 * 1024 if sys.platform == "darwin" else 1024), 1)
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Benchmark SMASB BOT retrieval backends")
+    parser.add_argument("--corpus", choices=["synthetic", "posts", "store"], default="synthetic")
+    parser.add_argument("--posts", type=int, default=10_000, help="synthetic corpus size")
+    parser.add_argument("--dim", type=int, default=256, help="fake embedder dimension")
+    parser.add_argument("--queries", type=int, default=300)
+    parser.add_argument("--k", type=int, default=5)
+    parser.add_argument("--n-probe", type=int, default=8)
+    parser.add_argument("--ef", type=int, default=64)
+    parser.add_argument("--candidates", type=int, default=64)
+    parser.add_argument("--alpha", type=float, default=0.7, help="hybrid vector weight")
+    parser.add_argument("--backends", default="", help="comma-separated subset to run")
+    parser.add_argument("--out", help="write JSON here instead of stdout")
+    args = parser.parse_args(argv)
+
+    started = time.perf_counter()
+    embedder = None
+    if args.corpus == "store":
+        index = load_store_index()
+    else:
+        embedder = FakeEmbedder(args.dim)
+        if args.corpus == "posts":
+            with open("facebook_posts.json", "r", encoding="utf-8") as f:
+                posts = [p for p in json.load(f) if p["content"].strip()]
+        else:
+            posts = synthetic_posts(args.posts)
+        index = embed_posts(posts, embedder)
+    # Contiguous in-memory copy, so a memory-mapped store is not timed from disk
+    index.matrix = np.ascontiguousarray(index.matrix, dtype=np.float32)
+    queries = make_queries(index, args.queries, embedder)
+    load_seconds = time.perf_counter() - started
+
+    truth = exact_truth(index, queries, args.k)
+    wanted = set(filter(None, args.backends.split(",")))
+    backends = build_backends(index, args, wanted)
+
+    results = {}
+    for name, (build_seconds, build_bytes, search) in backends.items():
+        results[name] = {
+            "build_s": round(build_seconds, 3),
+            "build_mb": round(build_bytes / 2**20, 2),
+            **run_backend(search, queries, truth, args.k),
+        }
+        print(f"  {name:8s} {results[name]}", file=sys.stderr)
+
+    report = {
+        "corpus": args.corpus,
+        "posts": len(index),
+        "rows": int(index.matrix.shape[0]),
+        "dim": int(index.dim),
+        "matrix_mb": round(index.matrix.nbytes / 2**20, 2),
+        "queries": len(queries),
+        "k": args.k,
+        "load_s": round(load_seconds, 3),
+        "params": {"n_probe": args.n_probe, "ef": args.ef, "candidates": args.candidates, "alpha": args.alpha},
+        "backends": results,
+        "max_rss_mb": max_rss_mb(),
+        "python": platform.python_version(),
+        "numpy": np.__version__,
+        "timestamp": time.strftime("%Y-%m-%dT%H:%M:%S"),
+    }
+    text = json.dumps(report, indent=2)
+    if args.out:
+        with open(args.out, "w", encoding="utf-8") as f:
+            f.write(text + "\n")
+    else:
+        print(text)
+    return report
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,114 @@
+# bm25_index.py
+"""
+SMASB BOT - Lexical (BM25) Index
+Description:
+    In-process inverted index over the post texts. It catches exact
+    keyword matches (names, Urdu terms) that embeddings can miss and needs
+    no network call, so a clearly lexical question can be answered
+    without embedding it at all.
+
+    Tokenisation is Unicode-aware: NFKC, Discord mentions removed, Arabic
+    diacritics and tatweel stripped, Arabic/Urdu letter variants folded
+    (ك→ک, ي/ى→ی, ه/ۀ→ہ, أ/إ/آ→ا, ؤ→و) and Urdu/Arabic digits mapped to ASCII.
+"""
+
+import math
+import re
+import unicodedata
+from collections import Counter
+
+import numpy as np
+
+from query_cache import MENTION_RE
+
+DIACRITICS_RE = re.compile("[\u0610-\u061A\u064B-\u065F\u0670\u06D6-\u06ED\u0640]")
+LETTER_FOLD = str.maketrans({
+    "ك": "ک", "ي": "ی", "ى": "ی", "ه": "ہ", "ۀ": "ہ",
+    "أ": "ا", "إ": "ا", "آ": "ا", "ٱ": "ا", "ؤ": "و",
+    **{chr(0x0660 + d): str(d) for d in range(10)},
+    **{chr(0x06F0 + d): str(d) for d in range(10)},
+})
+TOKEN_RE = re.compile(r"\w+")
+
+
+def tokenize(text):
+    text = unicodedata.normalize("NFKC", MENTION_RE.sub(" ", text))
+    text = DIACRITICS_RE.sub("", text).translate(LETTER_FOLD).casefold()
+    return TOKEN_RE.findall(text)
+
+
+class BM25Index:
+    def __init__(self, posts, k1=1.5, b=0.75):
+        self.posts = posts
+        self.k1 = k1
+        self.b = b
+        postings = {}
+        doc_len = []
+        for doc_id, post in enumerate(posts):
+            tokens = tokenize(post["content"])
+            doc_len.append(len(tokens))
+            for term, tf in Counter(tokens).items():
+                ids, tfs = postings.setdefault(term, ([], []))
+                ids.append(doc_id)
+                tfs.append(tf)
+
+        n_docs = len(posts)
+        self.doc_len = np.array(doc_len, dtype=np.float32)
+        self.avgdl = float(self.doc_len.mean()) if n_docs and self.doc_len.sum() else 1.0
+        self.postings = {}
+        for term, (ids, tfs) in postings.items():
+            idf = math.log(1 + (n_docs - len(ids) + 0.5) / (len(ids) + 0.5))
+            self.postings[term] = (np.array(ids, dtype=np.int32), np.array(tfs, dtype=np.float32), idf)
+
+    def scores(self, query):
+        """BM25 score of every post and how many query terms each one contains."""
+        scores = np.zeros(len(self.posts), dtype=np.float32)
+        matched = np.zeros(len(self.posts), dtype=np.int32)
+        terms = set(tokenize(query))
+        for term in terms:
+            if term not in self.postings:
+                continue
+            ids, tfs, idf = self.postings[term]
+            norm = self.k1 * (1 - self.b + self.b * self.doc_len[ids] / self.avgdl)
+            scores[ids] += idf * tfs * (self.k1 + 1) / (tfs + norm)
+            matched[ids] += 1
+        return scores, matched, len(terms)
+
+    def search(self, query, k=5):
+        scores, _, _ = self.scores(query)
+        top = np.argsort(-scores)[:k]
+        return [(self.posts[i], float(scores[i])) for i in top if scores[i] > 0]
+
+    def confident_match(self, query, margin=2.0, min_terms=2):
+        """The best post if the lexical match alone is decisive, else None.
+
+        Decisive means: the query has at least ``min_terms`` terms, the best
+        post contains all of them, and it outscores the runner-up by ``margin``.
+        """
+        scores, matched, n_terms = self.scores(query)
+        if n_terms < min_terms or len(scores) == 0:
+            return None
+        top = np.argsort(-scores)[:2]
+        best = top[0]
+        if matched[best] < n_terms or scores[best] <= 0:
+            return None
+        if len(top) > 1 and scores[top[1]] * margin > scores[best]:
+            return None
+        return self.posts[best]
+
+
+def fuse_scores(vector_scores, lexical_scores, alpha=0.7):
+    """Convex mix of min-max normalised vector and BM25 post scores.
+
+    Posts the vector side did not score (-inf, e.g. outside the ANN
+    candidates) count as its minimum.
+    """
+    def normalise(values):
+        values = np.where(np.isfinite(values), values, np.nan)
+        if np.isnan(values).all():
+            return np.zeros(len(values))
+        low, high = np.nanmin(values), np.nanmax(values)
+        values = np.nan_to_num(values, nan=low)
+        return (values - low) / (high - low) if high > low else np.zeros_like(values)
+
+    return alpha * normalise(vector_scores) + (1 - alpha) * normalise(lexical_scores)
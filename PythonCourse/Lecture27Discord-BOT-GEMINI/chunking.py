@@ -0,0 +1,93 @@
+# chunking.py
+"""
+SMASB BOT - Post Chunking
+Description:
+    Splits posts into overlapping chunks of at most CHUNK_TOKENS tokens
+    that end on sentence boundaries (. ! ? and the Urdu ۔ ؟, or a line
+    break). Consecutive chunks share up to CHUNK_OVERLAP tokens of whole
+    sentences, so a thought cut at a boundary still appears intact in one
+    of them. A single sentence longer than a chunk is split on tokens.
+
+    Sentences from all posts are tokenised with one encode_batch call,
+    which is much faster than encoding post by post. The chunker's
+    config() is stored with the embeddings; changing it re-embeds.
+"""
+
+import os
+import re
+
+CHUNK_TOKENS = 512
+CHUNK_OVERLAP = 64
+
+# A sentence runs up to end punctuation followed by a space (so "3.5" is
+# not split), or up to a line break; the trailing whitespace stays with it
+SENTENCE_RE = re.compile(r".*?(?:[.!?؟۔]+(?=\s|$)|\n|$)\s*", re.S)
+
+
+def split_sentences(text):
+    return [s for s in SENTENCE_RE.findall(text) if s]
+
+
+class Chunker:
+    def __init__(self, enc, max_tokens=CHUNK_TOKENS, overlap=CHUNK_OVERLAP):
+        if not 0 <= overlap < max_tokens:
+            raise ValueError("overlap must be smaller than max_tokens")
+        self.enc = enc
+        self.max_tokens = max_tokens
+        self.overlap = overlap
+
+    @classmethod
+    def from_env(cls, enc):
+        return cls(
+            enc,
+            max_tokens=int(os.getenv("CHUNK_TOKENS", str(CHUNK_TOKENS))),
+            overlap=int(os.getenv("CHUNK_OVERLAP", str(CHUNK_OVERLAP))),
+        )
+
+    def config(self):
+        return {"encoding": getattr(self.enc, "name", None), "max_tokens": self.max_tokens, "overlap": self.overlap}
+
+    def _pieces(self, sentence_tokens):
+        """Sentence token lists, with over-long sentences cut into windows."""
+        step = self.max_tokens - self.overlap
+        for tokens in sentence_tokens:
+            if len(tokens) <= self.max_tokens:
+                yield tokens
+            else:
+                for start in range(0, len(tokens) - self.overlap, step):
+                    yield tokens[start:start + self.max_tokens]
+
+    def _pack(self, sentence_tokens):
+        chunks, current, size = [], [], 0
+        for tokens in self._pieces(sentence_tokens):
+            if current and size + len(tokens) > self.max_tokens:
+                chunks.append([t for piece in current for t in piece])
+                # Carry whole trailing sentences (up to the overlap) forward
+                carried, carried_size = [], 0
+                for piece in reversed(current):
+                    if carried_size + len(piece) > self.overlap or carried_size + len(piece) + len(tokens) > self.max_tokens:
+                        break
+                    carried.insert(0, piece)
+                    carried_size += len(piece)
+                current, size = carried, carried_size
+            current.append(tokens)
+            size += len(tokens)
+        if current:
+            chunks.append([t for piece in current for t in piece])
+        return chunks
+
+    def chunk_tokens_many(self, texts):
+        """Token lists of every chunk, per text; all sentences encoded in one batch."""
+        sentences = [split_sentences(text) for text in texts]
+        encoded = iter(self.enc.encode_batch([s for group in sentences for s in group]))
+        return [self._pack([next(encoded) for _ in group]) for group in sentences]
+
+    def chunk_many(self, texts):
+        """``[(chunk_text, n_tokens), ...]`` per text."""
+        decoded = []
+        for chunks in self.chunk_tokens_many(texts):
+            decoded.append([(self.enc.decode(tokens), len(tokens)) for tokens in chunks])
+        return decoded
+
+    def chunk_text(self, text):
+        return [chunk for chunk, _ in self.chunk_many([text])[0]]
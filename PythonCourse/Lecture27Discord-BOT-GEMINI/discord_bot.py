@@ -1,7 +1,11 @@
+import asyncio
 import discord
 from dotenv import load_dotenv
 import os
 from similarity_search import find_similar_post
+from ann_index import EXACT_SEARCH
+from mention_queue import MentionQueue
+from discord_stream import send_streaming, gemini_text
 from google import genai
 
 load_dotenv()
@@ -11,6 +15,7 @@ GEMINI_API_KEY = os.getenv("GEMINI_API_KEY")
 intents = discord.Intents.default()
 intents.message_content = True
 client = discord.Client(intents=intents)
+gemini = genai.Client(api_key=GEMINI_API_KEY)
 
 
 @client.event
@@ -18,18 +23,15 @@ async def on_ready():
     print(f"✅ Bot logged in as {client.user}")
 
 
-@client.event
-async def on_message(message):
-    if message.author == client.user:
+async def answer_mention(message):
+    query = message.content
+    # Retrieval is synchronous (OpenAI + NumPy): keep it off the event loop
+    post = await asyncio.to_thread(find_similar_post, query, exact=EXACT_SEARCH)
+    if not post:
+        await message.channel.send("معذرت، کوئی متعلقہ پوسٹ نہیں ملی۔")
         return
-    if client.user in message.mentions:
-        query = message.content
-        post = find_similar_post(query)
-        if not post:
-            await message.channel.send("معذرت، کوئی متعلقہ پوسٹ نہیں ملی۔")
-            return
 
-        prompt = f"""
+    prompt = f"""
 Context:
 {post['content']}
 
@@ -38,11 +40,22 @@ Question:
 
 Answer in simple Urdu.
 """
-        gemini = genai.Client(api_key=GEMINI_API_KEY)
-        response = gemini.models.generate_content(
-            model="gemini-2.5-flash", contents=prompt
-        )
-        await message.channel.send(response.text)
+    # Post the answer as it is generated and edit it while tokens arrive
+    stream = await gemini.aio.models.generate_content_stream(
+        model="gemini-2.5-flash", contents=prompt
+    )
+    await send_streaming(message.channel, gemini_text(stream))
+
+
+mentions = MentionQueue.from_env(answer_mention)
+
+
+@client.event
+async def on_message(message):
+    if message.author == client.user:
+        return
+    if client.user in message.mentions:
+        await mentions.submit(message)
 
 
 client.run(DISCORD_TOKEN)
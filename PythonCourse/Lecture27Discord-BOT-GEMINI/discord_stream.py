@@ -0,0 +1,53 @@
+# discord_stream.py
+"""
+SMASB BOT - Streaming Discord Replies
+Description:
+    Shows a Gemini answer while it is still being generated: the reply is
+    posted as soon as the first tokens arrive and then edited in place at
+    most once per EDIT_INTERVAL seconds (Discord rate-limits edits).
+    Answers longer than one Discord message continue in a new message.
+"""
+
+import time
+
+DISCORD_LIMIT = 2000
+EDIT_INTERVAL = 1.0
+
+
+async def send_streaming(channel, chunks, edit_interval=EDIT_INTERVAL, limit=DISCORD_LIMIT):
+    """Stream an async iterable of text pieces into ``channel``; returns the full text."""
+    full_text, current, shown, message, last_edit = "", "", "", None, 0.0
+
+    async for piece in chunks:
+        if not piece:
+            continue
+        full_text += piece
+        current += piece
+
+        while len(current) > limit:
+            # Close the current message at the limit and carry on in a new one
+            head, current = current[:limit], current[limit:]
+            if message is None:
+                await channel.send(head)
+            else:
+                await message.edit(content=head)
+            message = None
+
+        now = time.monotonic()
+        if message is None:
+            if current:
+                message, shown, last_edit = await channel.send(current), current, now
+        elif now - last_edit >= edit_interval:
+            await message.edit(content=current)
+            shown, last_edit = current, now
+
+    if message is not None and shown != current:
+        await message.edit(content=current)
+    return full_text
+
+
+async def gemini_text(stream):
+    """Text pieces from a ``generate_content_stream`` response."""
+    async for chunk in stream:
+        if chunk.text:
+            yield chunk.text
@@ -0,0 +1,176 @@
+# embedders.py
+"""
+SMASB BOT - Embedding Backends
+Description:
+    One interface for every way of turning text into vectors, chosen with
+    EMBED_BACKEND (and optionally EMBED_MODEL):
+
+      * openai  -- text-embedding-3-small over the network (default)
+      * ollama  -- a local Ollama server's /api/embed (bge-m3 by default,
+                   the same stand-in ScholarGPT uses), OLLAMA_URL
+      * local   -- sentence-transformers on the CPU, in process
+                   (pip install sentence-transformers)
+
+    Every embedder has a ``name`` ("backend:model") that is stored with
+    the index, so vectors from different backends are never mixed.
+    embed() takes any number of texts; callers batch with the
+    embedder's max_batch_inputs / max_batch_tokens.
+"""
+
+import asyncio
+import json
+import os
+import random
+import time
+import urllib.request
+
+import numpy as np
+
+DEFAULT_MODELS = {
+    "openai": "text-embedding-3-small",
+    "ollama": "bge-m3",
+    "local": "sentence-transformers/paraphrase-multilingual-MiniLM-L12-v2",
+}
+MAX_RETRIES = 6
+
+
+class Embedder:
+    backend = None
+    # Per-request limits used by embeddings_manager.make_batches
+    max_batch_inputs = 256
+    max_batch_tokens = 250_000
+
+    def __init__(self, model):
+        self.model = model
+
+    @property
+    def name(self):
+        return f"{self.backend}:{self.model}"
+
+    def embed(self, texts):
+        """One vector (np.ndarray) per text, in order."""
+        raise NotImplementedError
+
+    async def aembed(self, texts):
+        return await asyncio.to_thread(self.embed, texts)
+
+
+# =====================================================
+# OpenAI
+# =====================================================
+def retry_delay(error, attempt):
+    retry_after = getattr(getattr(error, "response", None), "headers", {}).get("retry-after")
+    return float(retry_after) if retry_after else min(60, 2 ** attempt) + random.random()
+
+
+class OpenAIEmbedder(Embedder):
+    backend = "openai"
+    # OpenAI limits for one embeddings.create call (kept a little under the max)
+    max_batch_inputs = 2048
+    max_batch_tokens = 250_000
+
+    def __init__(self, model=DEFAULT_MODELS["openai"], api_key=None):
+        super().__init__(model)
+        import openai
+
+        # One client of each kind for every request; retries are handled below
+        self.client = openai.OpenAI(api_key=api_key, max_retries=0)
+        self.async_client = openai.AsyncOpenAI(api_key=api_key, max_retries=0)
+        self.retryable = (
+            openai.RateLimitError,
+            openai.APITimeoutError,
+            openai.APIConnectionError,
+            openai.InternalServerError,
+        )
+
+    @staticmethod
+    def _vectors(response):
+        return [np.array(d.embedding) for d in sorted(response.data, key=lambda d: d.index)]
+
+    def embed(self, texts):
+        """One embeddings.create call with exponential backoff on rate limits."""
+        for attempt in range(MAX_RETRIES + 1):
+            try:
+                return self._vectors(self.client.embeddings.create(input=texts, model=self.model))
+            except self.retryable as e:
+                if attempt == MAX_RETRIES:
+                    raise
+                delay = retry_delay(e, attempt)
+                print(f"⏳ {type(e).__name__}, retrying in {delay:.1f}s")
+                time.sleep(delay)
+
+    async def aembed(self, texts):
+        for attempt in range(MAX_RETRIES + 1):
+            try:
+                return self._vectors(await self.async_client.embeddings.create(input=texts, model=self.model))
+            except self.retryable as e:
+                if attempt == MAX_RETRIES:
+                    raise
+                await asyncio.sleep(retry_delay(e, attempt))
+
+
+# =====================================================
+# Ollama (local server)
+# =====================================================
+class OllamaEmbedder(Embedder):
+    backend = "ollama"
+    max_batch_inputs = 64
+
+    def __init__(self, model=DEFAULT_MODELS["ollama"], url=None, timeout=120):
+        super().__init__(model)
+        self.url = (url or os.getenv("OLLAMA_URL", "http://localhost:11434")).rstrip("/") + "/api/embed"
+        self.timeout = timeout
+
+    def embed(self, texts):
+        body = json.dumps({"model": self.model, "input": list(texts)}).encode("utf-8")
+        request = urllib.request.Request(self.url, data=body, headers={"Content-Type": "application/json"})
+        with urllib.request.urlopen(request, timeout=self.timeout) as response:
+            return [np.array(e) for e in json.load(response)["embeddings"]]
+
+
+# =====================================================
+# sentence-transformers (in process, CPU)
+# =====================================================
+class SentenceTransformerEmbedder(Embedder):
+    backend = "local"
+    max_batch_inputs = 512
+
+    def __init__(self, model=DEFAULT_MODELS["local"], batch_size=32, threads=None):
+        super().__init__(model)
+        try:
+            import torch
+            from sentence_transformers import SentenceTransformer
+        except ImportError:
+            raise RuntimeError("EMBED_BACKEND=local needs `pip install sentence-transformers`")
+        if threads:
+            torch.set_num_threads(threads)
+        self.encoder = SentenceTransformer(model, device="cpu")
+        self.batch_size = batch_size
+
+    def embed(self, texts):
+        # Length-sorted batches pad each batch only to its longest text
+        order = np.argsort([len(t) for t in texts], kind="stable")
+        vectors = self.encoder.encode(
+            [texts[i] for i in order], batch_size=self.batch_size, convert_to_numpy=True
+        )
+        result = [None] * len(texts)
+        for position, i in enumerate(order):
+            result[i] = vectors[position]
+        return result
+
+
+BACKENDS = {
+    "openai": OpenAIEmbedder,
+    "ollama": OllamaEmbedder,
+    "local": SentenceTransformerEmbedder,
+}
+
+
+def make_embedder(backend="openai", model=None, **options):
+    if backend not in BACKENDS:
+        raise ValueError(f"Unknown EMBED_BACKEND {backend!r} (choose from {', '.join(BACKENDS)})")
+    return BACKENDS[backend](model or DEFAULT_MODELS[backend], **options)
+
+
+def embedder_from_env(**options):
+    return make_embedder(os.getenv("EMBED_BACKEND", "openai"), os.getenv("EMBED_MODEL") or None, **options)
@@ -0,0 +1,219 @@
+# embedding_store.py
+"""
+SMASB BOT - Memory-Mapped Embedding Store
+Description:
+    Binary replacement for the embeddings.joblib pickle.
+
+      embeddings.meta.json         -- post ids, content hashes, row offsets,
+                                      generation, embedder name, dim and
+                                      chunking settings
+      embeddings.g<N>.npy          -- float32 (rows, dim) matrix, rows L2-normalised
+      embeddings.g<N>.posts.ndjson -- the post dicts, one per line
+
+    The matrix is opened with np.load(mmap_mode="r") and the posts file is
+    memory-mapped too, a post being parsed only when it is read, so every
+    process (uvicorn workers, the Discord bot) shares the same pages
+    through the OS cache and keeps no private copy of the corpus. A new generation
+    is written beside the old one and the metadata file is swapped last,
+    so readers always see a complete store, and long-running readers can
+    poll store_stamp() and reopen when a new generation is published.
+
+Usage:
+    python embedding_store.py [embeddings.joblib]   # convert an old pickle
+    python embeddings_manager.py                    # then embed what it could not keep
+"""
+
+import json
+import mmap
+import os
+import sys
+
+import numpy as np
+from numpy.lib.format import open_memmap
+
+from vector_index import VectorIndex, normalize_rows
+
+STORE_FILE = "embeddings.meta.json"
+FORMAT_VERSION = 2  # 1 kept the post dicts in the metadata file
+LEGACY_EMBEDDER = "openai:text-embedding-3-small"  # what embeddings.joblib holds
+
+
+def matrix_path(store_file, generation, suffix=".npy"):
+    folder = os.path.dirname(store_file)
+    base = os.path.basename(store_file).split(".")[0]
+    return os.path.join(folder, f"{base}.g{generation}{suffix}")
+
+
+def temp_path(path):
+    # Per process, so two writers never rename each other's half-written file
+    return f"{path}.{os.getpid()}.tmp"
+
+
+def posts_path(store_file, generation):
+    return matrix_path(store_file, generation, ".posts.ndjson")
+
+
+class PostFile:
+    """Read-only list of the posts in an NDJSON file, parsed on access.
+
+    ``line_offsets`` holds the byte offset of every line plus the file
+    size, so post ``i`` is the slice between entries ``i`` and ``i + 1``.
+    """
+
+    def __init__(self, path, line_offsets):
+        self.line_offsets = line_offsets
+        with open(path, "rb") as f:
+            # mmap rejects empty files; an empty store has no lines to read
+            self.data = mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ) if line_offsets[-1] else b""
+
+    def __len__(self):
+        return len(self.line_offsets) - 1
+
+    def __getitem__(self, i):
+        if isinstance(i, slice):
+            return [self[j] for j in range(*i.indices(len(self)))]
+        if i < 0:
+            i += len(self)
+        if not 0 <= i < len(self):
+            raise IndexError("post index out of range")
+        return json.loads(self.data[self.line_offsets[i]:self.line_offsets[i + 1]])
+
+    def __iter__(self):
+        return (self[i] for i in range(len(self)))
+
+
+def read_meta(store_file=STORE_FILE):
+    with open(store_file, "r", encoding="utf-8") as f:
+        return json.load(f)
+
+
+def store_stamp(store_file=STORE_FILE):
+    """Cheap change check: the metadata file is replaced for every generation."""
+    stat = os.stat(store_file)
+    return stat.st_ino, stat.st_mtime_ns, stat.st_size
+
+
+def write_store(items, store_file=STORE_FILE, chunking=None, embedder=None):
+    """Write ``[{"post", "hash", "embeddings"}, ...]`` as a new store generation.
+
+    ``chunking`` (Chunker config) and ``embedder`` (its name) record how
+    the embeddings were made.
+    """
+    items = [item for item in items if len(item["embeddings"])]
+    generation = read_meta(store_file)["generation"] + 1 if os.path.exists(store_file) else 1
+    n_rows = sum(len(item["embeddings"]) for item in items)
+    dim = len(items[0]["embeddings"][0]) if items else 0
+
+    path = matrix_path(store_file, generation)
+    tmp_path = temp_path(path)
+    matrix = open_memmap(tmp_path, mode="w+", dtype=np.float32, shape=(n_rows, dim))
+    offsets, row = [], 0
+    for item in items:
+        offsets.append(row)
+        rows = normalize_rows(np.asarray(item["embeddings"]))
+        matrix[row:row + len(rows)] = rows
+        row += len(rows)
+    matrix.flush()
+    del matrix
+    os.replace(tmp_path, path)
+
+    post_file = posts_path(store_file, generation)
+    line_offsets = [0]
+    tmp_posts = temp_path(post_file)
+    with open(tmp_posts, "wb") as f:
+        for item in items:
+            line_offsets.append(line_offsets[-1] + f.write(
+                json.dumps(item["post"], ensure_ascii=False).encode("utf-8") + b"\n"
+            ))
+    os.replace(tmp_posts, post_file)
+
+    meta = {
+        "format": FORMAT_VERSION,
+        "generation": generation,
+        "matrix": os.path.basename(path),
+        "rows": n_rows,
+        "dim": dim,
+        "chunking": chunking,
+        "embedder": embedder,
+        "offsets": offsets,
+        "post_ids": [item["post"]["post"] for item in items],
+        "hashes": [item["hash"] for item in items],
+        "posts": os.path.basename(post_file),
+        "post_offsets": line_offsets,
+    }
+    tmp_meta = temp_path(store_file)
+    with open(tmp_meta, "w", encoding="utf-8") as f:
+        json.dump(meta, f, ensure_ascii=False)
+    os.replace(tmp_meta, store_file)
+
+    # Old generations are no longer referenced; processes that still map
+    # them keep their pages until they reopen (removal may fail on Windows)
+    for old in range(1, generation):
+        for old_path in (matrix_path(store_file, old), posts_path(store_file, old)):
+            try:
+                os.remove(old_path)
+            except OSError:
+                pass
+    return meta
+
+
+def open_store(store_file=STORE_FILE, expected=None):
+    """Open the store as a VectorIndex over a read-only memory-mapped matrix.
+
+    With ``expected`` (``{"embedder": name, "chunking": config}``), refuse
+    a store built another way: its vectors, or the chunk numbers that
+    rag_context re-creates, would not match this process.
+    """
+    meta = read_meta(store_file)
+    if meta["format"] not in (1, FORMAT_VERSION):
+        raise RuntimeError(f"Unsupported embedding store format {meta['format']}")
+    for key, value in (expected or {}).items():
+        if meta.get(key) != value:
+            raise RuntimeError(f"Embedding store was built with {key} {meta.get(key)}, not {value}")
+    folder = os.path.dirname(store_file)
+    matrix = np.load(os.path.join(folder, meta["matrix"]), mmap_mode="r")
+    if meta["format"] == 1:
+        posts = meta["posts"]
+    else:
+        posts = PostFile(os.path.join(folder, meta["posts"]), meta["post_offsets"])
+    index = VectorIndex(matrix, meta["offsets"], posts)
+    index.hashes = meta["hashes"]
+    index.generation = meta["generation"]
+    index.embedder = meta.get("embedder")
+    return index
+
+
+def store_items(index):
+    """Yield the store back as ``{"post", "hash", "embeddings"}`` items."""
+    bounds = np.append(index.offsets, len(index.matrix))
+    for i, post in enumerate(index.posts):
+        yield {"post": post, "hash": index.hashes[i], "embeddings": index.matrix[bounds[i]:bounds[i + 1]]}
+
+
+def convert_joblib(joblib_file="embeddings.joblib", store_file=STORE_FILE):
+    """Convert an old pickle, keeping only the vectors current settings reproduce.
+
+    The pickle was embedded with LEGACY_EMBEDDER over 7000-token windows.
+    A post that is a single chunk under both schemes has the same one
+    vector, so it is kept and the store is recorded with the current
+    embedder and chunking. Longer posts (and everything, with another
+    EMBED_BACKEND) are left out, for refresh_index to embed again.
+    """
+    import joblib
+    from embeddings_manager import content_hash, chunker, embedder, index_config
+
+    items = []
+    if embedder.name == LEGACY_EMBEDDER:
+        legacy = [item for item in joblib.load(joblib_file) if len(item["embeddings"]) == 1]
+        chunks = chunker.chunk_tokens_many([item["post"]["content"] for item in legacy])
+        for item, post_chunks in zip(legacy, chunks):
+            if len(post_chunks) == 1:
+                items.append({**item, "hash": item.get("hash") or content_hash(item["post"]["content"])})
+    return write_store(items, store_file, **index_config())
+
+
+if __name__ == "__main__":
+    source = sys.argv[1] if len(sys.argv) > 1 else "embeddings.joblib"
+    meta = convert_joblib(source)
+    print(f"✅ Converted {source} -> {STORE_FILE} ({len(meta['post_ids'])} single-chunk posts kept, "
+          f"{meta['rows']} rows); run embeddings_manager.py to embed the rest")
@@ -1,30 +1,237 @@
-import json, os, numpy as np, joblib
-from openai import OpenAI
+import asyncio, json, os, hashlib, numpy as np
+from concurrent.futures import ThreadPoolExecutor, as_completed
 from tiktoken import encoding_for_model
 from dotenv import load_dotenv
+from ann_index import ANN_BACKENDS, ann_files
+from query_cache import QueryEmbeddingCache
+from chunking import Chunker
+from embedders import embedder_from_env
+from embedding_store import STORE_FILE, read_meta, write_store, open_store, store_items, convert_joblib
 
-with open("facebook_posts.json", "r", encoding="utf-8") as f:
-    posts = json.load(f)
+JSON_FILE = "facebook_posts.json"
+EMBED_FILE = "embeddings.joblib"  # legacy pickle, converted on first load
+PROGRESS_FILE = "embeddings.progress.jsonl"
+MAX_WORKERS = int(os.getenv("EMBED_WORKERS", "4"))
 
+# Token counts (chunking, prompt budgets) always use the OpenAI tokenizer
 enc = encoding_for_model("text-embedding-3-small")
+chunker = Chunker.from_env(enc)  # CHUNK_TOKENS / CHUNK_OVERLAP
 load_dotenv()
-OPENAI_API_KEY = os.getenv("OPENAI_API_KEY")
 
-def chunk_text(text, max_tokens=7000):
-    tokens = enc.encode(text)
-    return [enc.decode(tokens[i:i+max_tokens]) for i in range(0, len(tokens), max_tokens)]
+# EMBED_BACKEND = openai | ollama | local (see embedders.py)
+embedder = embedder_from_env()
+
+# Question embeddings, shared by find_best_post and find_similar_post
+query_cache = QueryEmbeddingCache.from_env(f"{embedder.name}:{chunker.max_tokens}/{chunker.overlap}")
+
+def load_posts(json_file=JSON_FILE):
+    with open(json_file, "r", encoding="utf-8") as f:
+        if json_file.endswith((".ndjson", ".jsonl")):
+            return [json.loads(line) for line in f if line.strip()]
+        return json.load(f)
+
+def content_hash(text):
+    return hashlib.sha256(text.encode("utf-8")).hexdigest()
+
+def chunk_text(text):
+    return chunker.chunk_text(text)
+
+# =====================================================
+# Bulk Embedding Pipeline
+# =====================================================
+def make_batches(token_counts, max_inputs=None, max_tokens=None):
+    """Group chunk indices into requests that respect the input and token limits."""
+    max_inputs = max_inputs or embedder.max_batch_inputs
+    max_tokens = max_tokens or embedder.max_batch_tokens
+    batches, current, current_tokens = [], [], 0
+    for i, n in enumerate(token_counts):
+        if current and (len(current) >= max_inputs or current_tokens + n > max_tokens):
+            batches.append(current)
+            current, current_tokens = [], 0
+        current.append(i)
+        current_tokens += n
+    if current:
+        batches.append(current)
+    return batches
+
+def embed_batch(texts):
+    """One request to the configured embedder (see embedders.py)."""
+    return embedder.embed(texts)
+
+async def aembed_batch(texts):
+    """Async embed_batch for the API's event loop."""
+    return await embedder.aembed(texts)
 
 def get_embedding_safe(text):
     if not text.strip(): return []
-    client = OpenAI(api_key=OPENAI_API_KEY)
-    embeddings = []
-    for chunk in chunk_text(text):
-        response = client.embeddings.create(input=chunk, model="text-embedding-3-small")
-        embeddings.append(np.array(response.data[0].embedding))
-    return embeddings
-
-if os.path.exists("embeddings.joblib"):
-    post_embeddings = joblib.load("embeddings.joblib")
-else:
-    post_embeddings = [{"post": p, "embeddings": get_embedding_safe(p["content"])} for p in posts if p["content"].strip()]
-    joblib.dump(post_embeddings, "embeddings.joblib")
\ No newline at end of file
+    return query_cache.get_or_compute(text, lambda t: embed_batch(chunk_text(t)))
+
+async def acache_call(method, *args):
+    """Run a query_cache call; with the SQLite tier (QUERY_CACHE_DB) it does
+    file I/O and commits, so it runs in a thread, off the event loop."""
+    if query_cache.db is None:
+        return method(*args)
+    return await asyncio.to_thread(method, *args)
+
+async def aget_embedding_safe(text):
+    if not text.strip(): return []
+    vectors = await acache_call(query_cache.get, text)
+    if vectors is None:
+        vectors = await aembed_batch(chunk_text(text))
+        await acache_call(query_cache.put, text, vectors)
+    return vectors
+
+def index_config():
+    """What the stored vectors depend on; a store made differently is re-embedded."""
+    return {"embedder": embedder.name, "chunking": chunker.config()}
+
+def store_matches(store_file=STORE_FILE):
+    meta = read_meta(store_file)
+    return all(meta.get(key) == value for key, value in index_config().items())
+
+def load_progress(progress_file=PROGRESS_FILE):
+    done, config = {}, index_config()
+    if os.path.exists(progress_file):
+        with open(progress_file, "r", encoding="utf-8") as f:
+            for line in f:
+                try:
+                    record = json.loads(line)
+                except json.JSONDecodeError:
+                    break  # torn last line from an interrupted run
+                if any(record.get(key) != value for key, value in config.items()):
+                    continue
+                done[record["hash"]] = [np.array(e) for e in record["embeddings"]]
+    return done
+
+def build_post_embeddings(posts, progress_file=PROGRESS_FILE, max_workers=MAX_WORKERS):
+    """Embed every post, packing chunks from many posts into each request.
+
+    Posts are keyed by content hash, so duplicates are embedded once.
+    Finished posts are appended to ``progress_file`` as they complete, so an
+    interrupted build resumes from where it stopped.
+    """
+    done = load_progress(progress_file)
+    todo = {}
+    for p in posts:
+        h = content_hash(p["content"])
+        if h not in done and p["content"].strip():
+            todo[h] = p["content"]
+
+    chunks, owners = [], []
+    for h, post_chunks in zip(todo, chunker.chunk_many(list(todo.values()))):
+        chunks.extend(post_chunks)
+        owners.extend([h] * len(post_chunks))
+
+    vectors = [None] * len(chunks)
+    chunk_rows = {}
+    for i, h in enumerate(owners):
+        chunk_rows.setdefault(h, []).append(i)
+    remaining = {h: len(rows) for h, rows in chunk_rows.items()}
+
+    batches = make_batches([n for _, n in chunks])
+    print(f"🔢 Embedding {len(chunks)} chunks from {len(todo)} posts in {len(batches)} requests "
+          f"({len(done)} posts already done)")
+
+    with open(progress_file, "a", encoding="utf-8") as progress, \
+            ThreadPoolExecutor(max_workers=max_workers) as pool:
+        futures = {pool.submit(embed_batch, [chunks[i][0] for i in batch]): batch for batch in batches}
+        for n_done, future in enumerate(as_completed(futures), start=1):
+            batch = futures[future]
+            for i, vector in zip(batch, future.result()):
+                vectors[i] = vector
+                h = owners[i]
+                remaining[h] -= 1
+                if remaining[h] == 0:
+                    done[h] = [vectors[j] for j in chunk_rows[h]]
+                    progress.write(json.dumps({"hash": h, **index_config(), "embeddings": [v.tolist() for v in done[h]]}) + "\n")
+            progress.flush()
+            print(f"  {n_done}/{len(batches)} requests done")
+
+    items = []
+    for p in posts:
+        h = content_hash(p["content"])
+        if p["content"].strip():
+            items.append({"post": p, "hash": h, "embeddings": done.get(h, [])})
+    return items
+
+# =====================================================
+# Incremental Refresh
+# =====================================================
+def refresh_index(posts=None, store_file=STORE_FILE):
+    """Bring the embedding store in line with ``facebook_posts.json``.
+
+    Only new or changed posts are embedded; deleted posts are dropped and
+    unchanged ones keep their vectors. Kept posts stay in their old order
+    with new posts appended, so the ANN index can be extended in place
+    unless something was removed. Returns the refreshed VectorIndex.
+    """
+    posts = posts if posts is not None else load_posts()
+    if not os.path.exists(store_file) and os.path.exists(EMBED_FILE):
+        convert_joblib(EMBED_FILE, store_file)
+    old_items = list(store_items(open_store(store_file))) if os.path.exists(store_file) else []
+    rechunk = bool(old_items) and not store_matches(store_file)
+    if rechunk:
+        # Never mix vectors from another backend, model or chunking
+        print(f"✂️ Embedder or chunking changed (now {embedder.name}), re-embedding every post")
+        old_items = []
+
+    # Posts waiting for a slot, grouped by content (duplicate posts are common)
+    waiting = {}
+    for p in posts:
+        if p["content"].strip():
+            waiting.setdefault(content_hash(p["content"]), []).append(p)
+
+    kept, removed = [], 0
+    for item in old_items:
+        h = item["hash"]
+        if waiting.get(h):
+            kept.append({"post": waiting[h].pop(0), "hash": h, "embeddings": item["embeddings"]})
+        else:
+            removed += 1
+
+    known = {item["hash"]: item["embeddings"] for item in kept}
+    new_posts = [p for group in waiting.values() for p in group]
+    fresh = build_post_embeddings([p for p in new_posts if content_hash(p["content"]) not in known])
+    known.update({item["hash"]: item["embeddings"] for item in fresh})
+    added = [
+        {"post": p, "hash": content_hash(p["content"]), "embeddings": known[content_hash(p["content"])]}
+        for p in sorted(new_posts, key=lambda p: p["post"])
+    ]
+
+    if removed or rechunk:
+        # Rows shifted: the ANN index has to be rebuilt, not extended. Removed
+        # before the swap so no reader pairs it with the new generation.
+        for backend in ANN_BACKENDS:
+            for path in ann_files(store_file, backend):
+                if os.path.exists(path):
+                    os.remove(path)
+    write_store(kept + added, store_file, **index_config())
+    if os.path.exists(PROGRESS_FILE):
+        os.remove(PROGRESS_FILE)
+
+    print(f"♻️ {len(kept)} posts kept, {len(added)} added, {removed} removed "
+          f"({len(fresh)} embedded)")
+    return open_store(store_file)
+
+def load_post_index(store_file=STORE_FILE, posts=None):
+    """Open the memory-mapped store, converting or building it on first run."""
+    if os.path.exists(store_file) and store_matches(store_file):
+        return open_store(store_file)
+    # No store yet, a legacy pickle, or vectors from another embedder/chunking
+    return refresh_index(posts, store_file)
+
+def __getattr__(name):
+    # `from embeddings_manager import post_index` keeps working, but the
+    # posts and store are only loaded by modules that actually use them
+    if name == "posts":
+        value = load_posts()
+    elif name == "post_index":
+        value = load_post_index()
+    else:
+        raise AttributeError(f"module {__name__!r} has no attribute {name!r}")
+    globals()[name] = value
+    return value
+
+if __name__ == "__main__":
+    # Run after fb_scraper.py to pick up new, edited and deleted posts
+    print(f"✅ {len(refresh_index())} posts indexed")
@@ -1,19 +1,134 @@
-from bs4 import BeautifulSoup
+# fb_scraper.py
+"""
+SMASB BOT - Facebook Export Scraper
+Description:
+    Pulls the text of every post (div._2pin) out of a Facebook HTML
+    export. The file is read and parsed in fixed-size pieces with an
+    incremental HTMLParser, and posts are written out one line at a time
+    as they are found, so memory stays flat however large the export is.
+
+    Post text matches BeautifulSoup's get_text(strip=True): every text
+    node stripped and joined without a separator.
+
+Usage:
+    python fb_scraper.py [fbpost.html] [facebook_posts.json]
+    (an output ending in .ndjson / .jsonl is written as NDJSON)
+"""
+
 import json
+import os
+import sys
+from html.parser import HTMLParser
+
+HTML_FILE = "fbpost.html"
+JSON_FILE = "facebook_posts.json"
+POST_CLASS = "_2pin"
+READ_SIZE = 1 << 20  # characters fed to the parser at a time
+
+
+class PostParser(HTMLParser):
+    """Collects the text of each ``div._2pin`` into ``self.done``."""
+
+    def __init__(self):
+        super().__init__(convert_charrefs=True)
+        self.depth = 0      # open divs inside the current post, 0 = outside
+        self.text = []      # pieces of the current text node (split across feeds)
+        self.parts = []
+        self.done = []
+
+    def flush_text(self):
+        text = "".join(self.text).strip()
+        if text:
+            self.parts.append(text)
+        self.text = []
+
+    def handle_starttag(self, tag, attrs):
+        self.flush_text()
+        if tag != "div":
+            return
+        if self.depth:
+            self.depth += 1
+        elif POST_CLASS in (dict(attrs).get("class") or "").split():
+            self.depth = 1
+
+    def handle_endtag(self, tag):
+        self.flush_text()
+        if tag != "div" or not self.depth:
+            return
+        self.depth -= 1
+        if not self.depth:
+            self.done.append("".join(self.parts))
+            self.parts = []
+
+    def handle_data(self, data):
+        if self.depth:
+            self.text.append(data)
+
+    def handle_comment(self, data):
+        self.flush_text()
+
+
+def iter_posts(html_file=HTML_FILE, read_size=READ_SIZE):
+    """Yield ``{"post": n, "content": text}`` in document order."""
+    parser = PostParser()
+    number = 0
+    with open(html_file, "r", encoding="utf-8") as f:
+        while True:
+            data = f.read(read_size)
+            if data:
+                parser.feed(data)
+            else:
+                parser.close()
+            for content in parser.done:
+                number += 1
+                yield {"post": number, "content": content}
+            parser.done.clear()
+            if not data:
+                return
+
+
+def write_posts(posts, out_file=JSON_FILE):
+    """Write posts as they arrive; returns how many were written.
+
+    ``.ndjson``/``.jsonl`` files get one object per line, anything else a
+    JSON array (one post per line) that json.load still reads.
+    """
+    ndjson = out_file.endswith((".ndjson", ".jsonl"))
+    # Written beside the target and renamed at the end, so an interrupted
+    # scrape never leaves a truncated file that looks finished
+    tmp_file = f"{out_file}.{os.getpid()}.tmp"
+    try:
+        count = _write_posts(posts, tmp_file, ndjson)
+        os.replace(tmp_file, out_file)
+    finally:
+        if os.path.exists(tmp_file):
+            os.remove(tmp_file)
+    return count
 
-file_path = "fbpost.html"
 
-with open(file_path, "r", encoding="utf-8") as file:
-    html = file.read()
+def _write_posts(posts, out_file, ndjson):
+    count = 0
+    with open(out_file, "w", encoding="utf-8") as f:
+        if not ndjson:
+            f.write("[")
+        for post in posts:
+            if not ndjson:
+                f.write(",\n" if count else "\n")
+            f.write(json.dumps(post, ensure_ascii=False))
+            if ndjson:
+                f.write("\n")
+            count += 1
+        if not ndjson:
+            f.write("\n]\n")
+    return count
 
-soup = BeautifulSoup(html, "html.parser")
-posts = soup.find_all("div", class_="_2pin")
 
-data = []
-for idx, post in enumerate(posts, start=1):
-    data.append({"post": idx, "content": post.get_text(strip=True)})
+def scrape(html_file=HTML_FILE, out_file=JSON_FILE):
+    return write_posts(iter_posts(html_file), out_file)
 
-with open("facebook_posts.json", "w", encoding="utf-8") as f:
-    json.dump(data, f, ensure_ascii=False, indent=2)
 
-print(f"✅ Extracted {len(data)} posts")
\ No newline at end of file
+if __name__ == "__main__":
+    html_file = sys.argv[1] if len(sys.argv) > 1 else HTML_FILE
+    out_file = sys.argv[2] if len(sys.argv) > 2 else JSON_FILE
+    print(f"✅ Extracted {scrape(html_file, out_file)} posts")
+    print("ℹ️ Run `python embeddings_manager.py` to refresh the bot index")
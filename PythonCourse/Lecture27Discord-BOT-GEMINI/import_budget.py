@@ -0,0 +1,62 @@
+# import_budget.py
+"""
+SMASB BOT - Import-Time Budget
+Description:
+    Measures how long `import smasb_bot_api` takes in a fresh interpreter
+    (python -X importtime) and fails when it exceeds the budget, so a
+    heavy module-level import cannot creep back into the API and slow
+    down restarts and autoscaling. Prints the slowest top-level imports.
+
+Usage:
+    python import_budget.py [module] [--budget SECONDS]
+    (default module smasb_bot_api, budget IMPORT_BUDGET or 1.5 s)
+"""
+
+import argparse
+import os
+import subprocess
+import sys
+import time
+
+DEFAULT_BUDGET = float(os.getenv("IMPORT_BUDGET", "1.5"))
+
+
+def measure(module):
+    """Return (wall seconds, [(cumulative seconds, package), ...]) for one import."""
+    env = dict(os.environ)
+    # The API refuses to import without keys; none are used at import time
+    env.setdefault("OPENAI_API_KEY", "import-budget")
+    env.setdefault("GEMINI_API_KEY", "import-budget")
+    started = time.perf_counter()
+    result = subprocess.run(
+        [sys.executable, "-X", "importtime", "-c", f"import {module}"],
+        env=env, capture_output=True, text=True,
+    )
+    wall = time.perf_counter() - started
+    if result.returncode:
+        sys.stderr.write(result.stderr)
+        raise SystemExit(f"❌ import {module} failed")
+
+    top_level = []
+    for line in result.stderr.splitlines():
+        # "import time:  self [us] | cumulative | imported package"
+        if not line.startswith("import time:") or "cumulative" in line:
+            continue
+        _, cumulative, package = line[len("import time:"):].split("|")
+        if not package.startswith("  "):  # depth 0: imported by the module itself
+            top_level.append((int(cumulative) / 1e6, package.strip()))
+    return wall, sorted(top_level, reverse=True)
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description=__doc__.split("Usage:")[0])
+    parser.add_argument("module", nargs="?", default="smasb_bot_api")
+    parser.add_argument("--budget", type=float, default=DEFAULT_BUDGET)
+    args = parser.parse_args()
+
+    wall, top_level = measure(args.module)
+    for seconds, package in top_level[:10]:
+        print(f"  {seconds * 1000:8.1f} ms  {package}")
+    print(f"⏱️ import {args.module}: {wall:.2f}s (budget {args.budget:.2f}s)")
+    if wall > args.budget:
+        raise SystemExit(f"❌ Over budget by {wall - args.budget:.2f}s")
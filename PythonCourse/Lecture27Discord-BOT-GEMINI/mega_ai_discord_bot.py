@@ -1,79 +1,72 @@
-# mega_ai_discord_bot.py – Full One-File Version
-from bs4 import BeautifulSoup
-import json, os, numpy as np, joblib, discord
+# mega_ai_discord_bot.py – Full Bot Version (scrape, embed, search, reply)
+import asyncio, os, time, discord
 from dotenv import load_dotenv
-from sklearn.metrics.pairwise import cosine_similarity
-from tiktoken import encoding_for_model
-from openai import OpenAI
 from google import genai
+from fb_scraper import scrape
+from embeddings_manager import get_embedding_safe, index_config, load_post_index, load_posts
+from embedding_store import STORE_FILE, open_store, store_stamp
+from ann_index import ANN_BACKEND, ANN_CANDIDATES, EXACT_SEARCH, ann_params, load_ann, load_or_build_ann
+from mention_queue import MentionQueue
+from discord_stream import send_streaming, gemini_text
 
 # Environment
 load_dotenv()
 DISCORD_TOKEN = os.getenv("SECRET_KEY")
-OPENAI_API_KEY = os.getenv("OPENAI_API_KEY")
 GEMINI_API_KEY = os.getenv("GEMINI_API_KEY")
 
-# Scrape
-with open("fbpost.html", "r", encoding="utf-8") as f:
-    html = f.read()
-soup = BeautifulSoup(html, "html.parser")
-posts = [
-    {"post": i, "content": p.get_text(strip=True)}
-    for i, p in enumerate(soup.find_all("div", class_="_2pin"), start=1)
-]
-with open("facebook_posts.json", "w", encoding="utf-8") as f:
-    json.dump(posts, f, ensure_ascii=False, indent=2)
-
-# Embeddings
-enc = encoding_for_model("text-embedding-3-small")
-openai_client = OpenAI(api_key=OPENAI_API_KEY)
-
-
-def chunk_text(text, max_tokens=7000):
-    tokens = enc.encode(text)
-    return [
-        enc.decode(tokens[i : i + max_tokens])
-        for i in range(0, len(tokens), max_tokens)
-    ]
-
-
-def get_embeddings(text):
-    return [
-        np.array(
-            openai_client.embeddings.create(input=chunk, model="text-embedding-3-small")
-            .data[0]
-            .embedding
-        )
-        for chunk in chunk_text(text)
-    ]
-
-
-if os.path.exists("embeddings.joblib"):
-    post_embeddings = joblib.load("embeddings.joblib")
+# With INDEX_READ_ONLY=1 the store is published by publish_index.py on a
+# shared volume and only read here; otherwise this bot scrapes and builds it
+INDEX_READ_ONLY = os.getenv("INDEX_READ_ONLY", "0") == "1"
+
+
+def open_published():
+    """Wait for the published store, then open it (ANN only if it matches)."""
+    while not os.path.exists(STORE_FILE):
+        print("⏳ Waiting for publish_index.py to publish the index")
+        time.sleep(5)
+    index = open_store(STORE_FILE, index_config())
+    if ANN_BACKEND != "none":
+        index.ann = load_ann(index.matrix, STORE_FILE, ANN_BACKEND, **ann_params())
+    return index
+
+
+if INDEX_READ_ONLY:
+    index_stamp = store_stamp(STORE_FILE) if os.path.exists(STORE_FILE) else None
+    post_index = open_published()
 else:
-    post_embeddings = [
-        {"post": p, "embeddings": get_embeddings(p["content"])} for p in posts
-    ]
-    joblib.dump(post_embeddings, "embeddings.joblib")
+    # Scrape
+    scrape("fbpost.html", "facebook_posts.json")
+    posts = load_posts("facebook_posts.json")
+
+    # Embeddings (memory-mapped store, batched resumable build on first run)
+    post_index = load_post_index(STORE_FILE, posts)
+    if ANN_BACKEND != "none":
+        post_index.ann = load_or_build_ann(post_index.matrix, STORE_FILE, ANN_BACKEND, **ann_params())
+
+
+def current_index():
+    """The index to search; read-only bots switch to a newly published one."""
+    global post_index, index_stamp
+    if INDEX_READ_ONLY and store_stamp(STORE_FILE) != index_stamp:
+        try:
+            index_stamp = store_stamp(STORE_FILE)
+            post_index = open_published()
+        except (OSError, RuntimeError) as e:
+            print(f"⚠️ Index reload skipped: {e}")
+    return post_index
 
 
 # Similarity
-def find_best_post(query):
-    query_embeddings = get_embeddings(query)
-    best_score, best_post = 0, None
-    for item in post_embeddings:
-        for q in query_embeddings:
-            for p in item["embeddings"]:
-                score = cosine_similarity([q], [p])[0][0]
-                if score > best_score:
-                    best_score, best_post = score, item["post"]
-    return best_post
+def find_best_post(query, exact=True):
+    results = current_index().search(get_embedding_safe(query), k=1, exact=exact, n_candidates=ANN_CANDIDATES)
+    return results[0][0] if results else None
 
 
 # Discord Bot
 intents = discord.Intents.default()
 intents.message_content = True
 client = discord.Client(intents=intents)
+gemini = genai.Client(api_key=GEMINI_API_KEY)
 
 
 @client.event
@@ -81,22 +74,31 @@ async def on_ready():
     print(f"Bot logged in as {client.user}")
 
 
+async def answer_mention(message):
+    query = message.content
+    # Retrieval is synchronous (OpenAI + NumPy): keep it off the event loop
+    post = await asyncio.to_thread(find_best_post, query, exact=EXACT_SEARCH)
+    if not post:
+        await message.channel.send("معذرت، کوئی متعلقہ پوسٹ نہیں ملی.")
+        return
+    prompt = f"Context:\n{post['content']}\n\nQuestion:\n{query}\n\nAnswer in simple Urdu."
+    # Post the answer as it is generated and edit it while tokens arrive
+    stream = await gemini.aio.models.generate_content_stream(
+        model="gemini-2.5-flash", contents=prompt
+    )
+    await send_streaming(message.channel, gemini_text(stream))
+
+
+# Per-channel queue with backpressure and typing indicator
+mentions = MentionQueue.from_env(answer_mention)
+
+
 @client.event
 async def on_message(message):
     if message.author == client.user:
         return
     if client.user in message.mentions:
-        query = message.content
-        post = find_best_post(query)
-        if not post:
-            await message.channel.send("معذرت، کوئی متعلقہ پوسٹ نہیں ملی.")
-            return
-        prompt = f"Context:\n{post['content']}\n\nQuestion:\n{query}\n\nAnswer in simple Urdu."
-        gemini = genai.Client(api_key=GEMINI_API_KEY)
-        response = gemini.models.generate_content(
-            model="gemini-2.5-flash", contents=prompt
-        )
-        await message.channel.send(response.text)
+        await mentions.submit(message)
 
 
 client.run(DISCORD_TOKEN)
@@ -0,0 +1,83 @@
+# mention_queue.py
+"""
+SMASB BOT - Discord Mention Queue
+Description:
+    Keeps on_message fast so the gateway heartbeat never stalls. Mentions
+    are queued per channel (answered in the order they were asked) and a
+    global limit caps how many are answered at once. When too many are
+    waiting the bot says so instead of silently piling up work, and it
+    shows a typing indicator while an answer is being prepared.
+"""
+
+import asyncio
+import os
+import traceback
+
+BUSY_REPLY = "⏳ ابھی بہت سوالات آئے ہوئے ہیں، تھوڑی دیر بعد دوبارہ پوچھیں۔"
+QUEUED_REPLY = "⏳ مصروف ہوں، آپ کا سوال قطار میں #{position} پر ہے۔"
+ERROR_REPLY = "معذرت، جواب دینے میں مسئلہ پیش آیا۔"
+
+
+class MentionQueue:
+    def __init__(self, handler, max_pending=50, max_workers=4, idle_timeout=300):
+        self.handler = handler            # async def handler(message)
+        self.max_pending = max_pending    # waiting + running, all channels
+        self.slots = asyncio.Semaphore(max_workers)
+        self.idle_timeout = idle_timeout
+        self.channels = {}                # channel id -> asyncio.Queue
+        self.channel_pending = {}         # channel id -> waiting + running
+        self.workers = set()              # strong refs to running worker tasks
+        self.pending = 0
+
+    @classmethod
+    def from_env(cls, handler):
+        return cls(
+            handler,
+            max_pending=int(os.getenv("MAX_PENDING_MENTIONS", "50")),
+            max_workers=int(os.getenv("MENTION_WORKERS", "4")),
+        )
+
+    async def submit(self, message):
+        if self.pending >= self.max_pending:
+            await message.reply(BUSY_REPLY)
+            return
+
+        channel_id = message.channel.id
+        position = self.channel_pending.get(channel_id, 0)
+        self.pending += 1
+        self.channel_pending[channel_id] = position + 1
+        if channel_id not in self.channels:
+            self.channels[channel_id] = asyncio.Queue()
+            worker = asyncio.create_task(self._channel_worker(channel_id, self.channels[channel_id]))
+            self.workers.add(worker)
+            worker.add_done_callback(self.workers.discard)
+        self.channels[channel_id].put_nowait(message)
+
+        if position:
+            await message.reply(QUEUED_REPLY.format(position=position))
+
+    async def _channel_worker(self, channel_id, queue):
+        while True:
+            try:
+                message = await asyncio.wait_for(queue.get(), self.idle_timeout)
+            except asyncio.TimeoutError:
+                if queue.empty():
+                    del self.channels[channel_id]
+                    return
+                continue
+
+            try:
+                async with self.slots:
+                    async with message.channel.typing():
+                        await self.handler(message)
+            except Exception:
+                traceback.print_exc()
+                try:
+                    await message.channel.send(ERROR_REPLY)
+                except Exception:
+                    pass
+            finally:
+                self.pending -= 1
+                self.channel_pending[channel_id] -= 1
+                if not self.channel_pending[channel_id]:
+                    del self.channel_pending[channel_id]
@@ -0,0 +1,123 @@
+# metrics.py
+"""
+SMASB BOT - Request Metrics
+Description:
+    Span timings for every stage of a request (queue, embed, search,
+    context, answer cache, generate), token counts and cache hit/miss
+    counters, rendered in the Prometheus text format for GET /metrics.
+
+    The spans of the current request are also collected in a
+    RequestTimer (found through a context variable, so stages deep in the
+    call stack need no extra arguments) and can be sent back as a
+    Server-Timing header, which browser dev tools and curl -v show.
+
+    Values are per process; with several workers, scrape each one.
+"""
+
+import bisect
+import contextvars
+import threading
+import time
+from contextlib import contextmanager
+
+PREFIX = "smasb"
+BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0, 30.0, 60.0)
+
+
+def label_text(labels):
+    if not labels:
+        return ""
+    return "{" + ",".join(f'{k}="{v}"' for k, v in labels) + "}"
+
+
+class Metrics:
+    def __init__(self, prefix=PREFIX, buckets=BUCKETS):
+        self.prefix = prefix
+        self.buckets = buckets
+        self.lock = threading.Lock()
+        self.histograms = {}  # name -> {labels: [bucket counts..., +Inf count, sum]}
+        self.values = {}      # name -> (kind, {labels: value})
+
+    def observe(self, name, seconds, **labels):
+        key = tuple(sorted(labels.items()))
+        with self.lock:
+            series = self.histograms.setdefault(name, {})
+            counts = series.setdefault(key, [0] * (len(self.buckets) + 1) + [0.0])
+            counts[bisect.bisect_left(self.buckets, seconds)] += 1
+            counts[-1] += seconds
+
+    def inc(self, name, value=1, **labels):
+        key = tuple(sorted(labels.items()))
+        with self.lock:
+            _, series = self.values.setdefault(name, ("counter", {}))
+            series[key] = series.get(key, 0) + value
+
+    def set(self, name, value, kind="gauge", **labels):
+        """Record a value kept elsewhere (e.g. a cache's own hit counter)."""
+        key = tuple(sorted(labels.items()))
+        with self.lock:
+            self.values.setdefault(name, (kind, {}))[1][key] = value
+
+    def render(self):
+        lines = []
+        with self.lock:
+            for name, series in sorted(self.histograms.items()):
+                full = f"{self.prefix}_{name}"
+                lines.append(f"# TYPE {full} histogram")
+                for key, counts in sorted(series.items()):
+                    cumulative = 0
+                    for le, count in zip([*map(str, self.buckets), "+Inf"], counts[:-1]):
+                        cumulative += count
+                        lines.append(f"{full}_bucket{label_text(key + (('le', le),))} {cumulative}")
+                    lines.append(f"{full}_sum{label_text(key)} {counts[-1]:.6f}")
+                    lines.append(f"{full}_count{label_text(key)} {cumulative}")
+            for name, (kind, series) in sorted(self.values.items()):
+                full = f"{self.prefix}_{name}"
+                lines.append(f"# TYPE {full} {kind}")
+                for key, value in sorted(series.items()):
+                    lines.append(f"{full}{label_text(key)} {value}")
+        return "\n".join(lines) + "\n"
+
+
+class RequestTimer:
+    """Stages of one request, for the Server-Timing header."""
+
+    def __init__(self):
+        self.spans = []  # (stage, seconds)
+        self.notes = []  # (name, description), e.g. ("answer-cache", "hit")
+
+    def server_timing(self):
+        entries = [f"{stage};dur={seconds * 1000:.1f}" for stage, seconds in self.spans]
+        entries += [f'{name};desc="{desc}"' for name, desc in self.notes]
+        return ", ".join(entries)
+
+
+metrics = Metrics()
+current_timer = contextvars.ContextVar("current_timer", default=None)
+
+
+@contextmanager
+def span(stage):
+    """Time a block as ``stage`` in the stage histogram and the request's timer."""
+    started = time.perf_counter()
+    try:
+        yield
+    finally:
+        seconds = time.perf_counter() - started
+        metrics.observe("stage_seconds", seconds, stage=stage)
+        timer = current_timer.get()
+        if timer is not None:
+            timer.spans.append((stage, seconds))
+
+
+def record_cache(cache, hit):
+    result = "hit" if hit else "miss"
+    metrics.inc("cache_lookups_total", cache=cache, result=result)
+    timer = current_timer.get()
+    if timer is not None:
+        timer.notes.append((f"{cache}-cache", result))
+
+
+def record_tokens(kind, count):
+    if count:
+        metrics.inc("tokens_total", count, kind=kind)
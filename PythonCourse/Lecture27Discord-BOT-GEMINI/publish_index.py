@@ -0,0 +1,51 @@
+# publish_index.py
+"""
+SMASB BOT - Index Publisher
+Description:
+    The one process that writes the shared index when the API runs with
+    several workers (INDEX_READ_ONLY=1). It refreshes the memory-mapped
+    embedding store from facebook_posts.json, which publishes a new
+    generation, then brings the ANN index up to date for it. Workers map
+    the new matrix read-only and switch to it on their next poll.
+
+    The Procfile's web process runs it once and then starts read-only
+    uvicorn workers in the same container, so they see the same files.
+    Running it as its own process (--watch) beside read-only web and bot
+    processes needs a volume they all share; on Heroku and Render each
+    process type gets its own disk.
+
+Usage:
+    python publish_index.py                 # refresh once
+    python publish_index.py --watch 300     # keep checking every 300 s
+"""
+
+import argparse
+import os
+import time
+
+from embeddings_manager import JSON_FILE, load_posts, refresh_index
+from embedding_store import STORE_FILE
+from ann_index import ANN_BACKEND, ann_params, load_or_build_ann
+
+
+def publish(json_file=JSON_FILE, store_file=STORE_FILE, backend=ANN_BACKEND):
+    index = refresh_index(load_posts(json_file), store_file)
+    if backend != "none":
+        load_or_build_ann(index.matrix, store_file, backend, **ann_params(backend))
+    print(f"📦 Published generation {index.generation} ({len(index)} posts)")
+    return index
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Publish the shared embedding index")
+    parser.add_argument("--json", default=JSON_FILE)
+    parser.add_argument("--watch", type=float, default=0, help="seconds between checks of the posts file")
+    args = parser.parse_args()
+
+    publish(args.json)
+    last_change = os.stat(args.json).st_mtime_ns
+    while args.watch > 0:
+        time.sleep(args.watch)
+        if os.stat(args.json).st_mtime_ns != last_change:
+            last_change = os.stat(args.json).st_mtime_ns
+            publish(args.json)
@@ -0,0 +1,141 @@
+# query_cache.py
+"""
+SMASB BOT - Query Embedding Cache
+Description:
+    Repeated questions (very common on Discord) should not pay for another
+    embedding round-trip. Questions are normalised (case, spacing, mentions,
+    trailing punctuation) and their embeddings cached in two tiers:
+
+      * in-process LRU  -- bounded by QUERY_CACHE_SIZE entries
+      * SQLite on disk  -- optional (QUERY_CACHE_DB), shared by processes
+                           and kept across restarts, bounded by
+                           QUERY_CACHE_DB_SIZE entries (trimmed every 1%
+                           of that many inserts, not on each one)
+
+    Both tiers expire entries after QUERY_CACHE_TTL seconds.
+"""
+
+import hashlib
+import os
+import re
+import sqlite3
+import threading
+import time
+import unicodedata
+from collections import OrderedDict
+
+import numpy as np
+
+MENTION_RE = re.compile(r"<@[!&]?\d+>")
+TRAILING_PUNCT = " \t\n.!?؟۔،,"
+
+
+def normalize_question(text):
+    text = unicodedata.normalize("NFKC", MENTION_RE.sub(" ", text))
+    return " ".join(text.casefold().split()).strip(TRAILING_PUNCT)
+
+
+class QueryEmbeddingCache:
+    def __init__(self, namespace, max_entries=1024, ttl=86400, db_path=None, max_db_entries=100_000):
+        self.namespace = namespace  # e.g. the embedding model; never mix models
+        self.max_entries = max_entries
+        self.ttl = ttl
+        self.max_db_entries = max_db_entries
+        self.trim_every = max(1, max_db_entries // 100)
+        self.puts_since_trim = 0
+        self.lock = threading.Lock()
+        self.memory = OrderedDict()
+        self.hits = self.disk_hits = self.misses = 0
+        self.db = None
+        if db_path:
+            self.db = sqlite3.connect(db_path, check_same_thread=False)
+            self.db.execute("PRAGMA journal_mode=WAL")
+            self.db.execute(
+                "CREATE TABLE IF NOT EXISTS query_embeddings ("
+                "key TEXT PRIMARY KEY, created REAL, rows INTEGER, data BLOB)"
+            )
+            self.db.execute("CREATE INDEX IF NOT EXISTS query_embeddings_created ON query_embeddings(created)")
+            self.db.commit()
+
+    @classmethod
+    def from_env(cls, namespace):
+        return cls(
+            namespace,
+            max_entries=int(os.getenv("QUERY_CACHE_SIZE", "1024")),
+            ttl=float(os.getenv("QUERY_CACHE_TTL", "86400")),
+            db_path=os.getenv("QUERY_CACHE_DB") or None,
+            max_db_entries=int(os.getenv("QUERY_CACHE_DB_SIZE", "100000")),
+        )
+
+    def key(self, text):
+        return hashlib.sha1(f"{self.namespace}\n{normalize_question(text)}".encode("utf-8")).hexdigest()
+
+    def get(self, text):
+        key, now = self.key(text), time.time()
+        with self.lock:
+            entry = self.memory.get(key)
+            if entry is not None:
+                created, vectors = entry
+                if now - created <= self.ttl:
+                    self.memory.move_to_end(key)
+                    self.hits += 1
+                    return vectors
+                del self.memory[key]
+
+            if self.db is not None:
+                row = self.db.execute(
+                    "SELECT created, rows, data FROM query_embeddings WHERE key = ?", (key,)
+                ).fetchone()
+                if row is not None and now - row[0] <= self.ttl:
+                    vectors = list(np.frombuffer(row[2], dtype=np.float32).reshape(row[1], -1))
+                    self._remember(key, row[0], vectors)
+                    self.disk_hits += 1
+                    return vectors
+
+            self.misses += 1
+            return None
+
+    def put(self, text, vectors):
+        key, now = self.key(text), time.time()
+        with self.lock:
+            self._remember(key, now, vectors)
+            if self.db is not None and len(vectors):
+                data = np.asarray(vectors, dtype=np.float32).tobytes()
+                self.db.execute(
+                    "INSERT OR REPLACE INTO query_embeddings VALUES (?, ?, ?, ?)",
+                    (key, now, len(vectors), data),
+                )
+                self.db.execute("DELETE FROM query_embeddings WHERE created < ?", (now - self.ttl,))
+                # The size trim walks the whole table, so it runs in batches
+                self.puts_since_trim += 1
+                if self.puts_since_trim >= self.trim_every:
+                    self.puts_since_trim = 0
+                    self.db.execute(
+                        "DELETE FROM query_embeddings WHERE key IN (SELECT key FROM query_embeddings "
+                        "ORDER BY created DESC LIMIT -1 OFFSET ?)",
+                        (self.max_db_entries,),
+                    )
+                self.db.commit()
+
+    def _remember(self, key, created, vectors):
+        self.memory[key] = (created, vectors)
+        self.memory.move_to_end(key)
+        while len(self.memory) > self.max_entries:
+            self.memory.popitem(last=False)
+
+    def get_or_compute(self, text, compute):
+        vectors = self.get(text)
+        if vectors is None:
+            vectors = compute(text)
+            self.put(text, vectors)
+        return vectors
+
+    def stats(self):
+        lookups = self.hits + self.disk_hits + self.misses
+        return {
+            "hits": self.hits,
+            "disk_hits": self.disk_hits,
+            "misses": self.misses,
+            "hit_rate": (self.hits + self.disk_hits) / lookups if lookups else 0.0,
+            "size": len(self.memory),
+        }
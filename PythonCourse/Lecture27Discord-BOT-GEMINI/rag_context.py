@@ -0,0 +1,45 @@
+# rag_context.py
+"""
+SMASB BOT - Prompt Context Assembly
+Description:
+    Packs the best retrieved chunks (from several posts) into the Gemini
+    prompt, best first, until the token budget is used up. The budget is
+    measured with the same tiktoken encoder used for chunking.
+"""
+
+CONTEXT_TOKENS = 6000
+
+
+def build_context(hits, chunk_text, enc, max_tokens=CONTEXT_TOKENS):
+    """Return ``(context, used_hits)`` for ``(post, chunk_no, score)`` hits.
+
+    ``chunk_text`` re-creates a post's chunks, so the exact retrieved chunk
+    is quoted rather than the whole post. The first chunk is truncated if
+    it alone exceeds the budget; later ones that do not fit are skipped.
+    """
+    parts, used_hits, used_tokens = [], [], 0
+    for post, chunk_no, score in hits:
+        chunks = chunk_text(post["content"])
+        if chunk_no >= len(chunks):
+            continue
+        tokens = enc.encode(f"[Post {post['post']}]\n{chunks[chunk_no]}")
+        if used_tokens + len(tokens) > max_tokens:
+            if parts:
+                continue
+            tokens = tokens[:max_tokens]
+        parts.append(enc.decode(tokens))
+        used_hits.append((post, chunk_no, score))
+        used_tokens += len(tokens)
+    return "\n\n".join(parts), used_hits
+
+
+def build_prompt(context, question):
+    return f"""
+Context:
+{context}
+
+Question:
+{question}
+
+Answer in simple Urdu.
+"""
@@ -1,15 +1,32 @@
-from sklearn.metrics.pairwise import cosine_similarity
-from embeddings_manager import post_embeddings, get_embedding_safe
+import os
+import numpy as np
+from embeddings_manager import post_index, get_embedding_safe
+from embedding_store import STORE_FILE
+from ann_index import ANN_BACKEND, ANN_CANDIDATES, ann_params, load_or_build_ann
+from bm25_index import BM25Index, fuse_scores
+
+HYBRID_ALPHA = float(os.getenv("HYBRID_ALPHA", "0.7"))      # vector share of the fused score
+LEXICAL_MARGIN = float(os.getenv("LEXICAL_MARGIN", "2.0"))  # BM25 lead needed to skip embedding
+
+if ANN_BACKEND != "none":
+    post_index.ann = load_or_build_ann(post_index.matrix, STORE_FILE, ANN_BACKEND, **ann_params())
+
+# Same post order as post_index, so scores line up position by position
+post_bm25 = BM25Index(post_index.posts)
+
+def find_similar_post(query, exact=True):
+    # Lexical fast path: a decisive keyword match needs no embedding call
+    post = post_bm25.confident_match(query, margin=LEXICAL_MARGIN)
+    if post is not None:
+        return post
 
-def find_similar_post(query):
     query_embeddings = get_embedding_safe(query)
-    best_score, best_post = 0, None
-
-    for post_item in post_embeddings:
-        for query_chunk in query_embeddings:
-            for post_chunk in post_item["embeddings"]:
-                score = cosine_similarity([query_chunk], [post_chunk])[0][0]
-                if score > best_score:
-                    best_score = score
-                    best_post = post_item["post"]
-    return best_post
\ No newline at end of file
+    if len(query_embeddings) == 0 or len(post_index) == 0:
+        return None
+    vector_scores = post_index.scores(query_embeddings, exact=exact, n_candidates=ANN_CANDIDATES)
+    lexical_scores, _, _ = post_bm25.scores(query)
+    fused = fuse_scores(vector_scores, lexical_scores, HYBRID_ALPHA)
+    best = int(np.argmax(fused))
+    if vector_scores[best] <= 0 and lexical_scores[best] <= 0:
+        return None
+    return post_index.posts[best]
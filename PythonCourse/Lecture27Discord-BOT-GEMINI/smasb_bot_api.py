@@ -7,17 +7,25 @@ Description:
     AI-powered Retrieval-Augmented Generation (RAG) system.
     Retrieves relevant content from curated knowledge (Facebook posts)
     and generates simple Urdu answers using Gemini LLM.
+
+    Importing this module is kept cheap: the SDKs, NumPy and the index are
+    loaded in the background once the server is up. GET /ready answers
+    503 until then (use it as the readiness probe); see import_budget.py.
+
+    Multiple workers: the embedding matrix is memory-mapped, so every
+    worker shares one copy through the OS page cache. With
+    INDEX_READ_ONLY=1 workers never build or rewrite the store; it is
+    published by publish_index.py and each worker swaps to a new
+    generation within INDEX_POLL seconds, without a restart.
 """
 
-from fastapi import FastAPI, HTTPException
-from pydantic import BaseModel
-from bs4 import BeautifulSoup
-import os, json, numpy as np, joblib
+from fastapi import FastAPI, HTTPException, Request
+from fastapi.responses import JSONResponse, PlainTextResponse, StreamingResponse
+from pydantic import BaseModel, Field
+from contextlib import asynccontextmanager
+import os, json, asyncio, time, traceback
 from dotenv import load_dotenv
-from sklearn.metrics.pairwise import cosine_similarity
-from tiktoken import encoding_for_model
-from openai import OpenAI
-from google import genai
+from metrics import metrics, span, record_cache, record_tokens, current_timer, RequestTimer
 
 # =====================================================
 # Load Environment Variables
@@ -26,13 +34,139 @@ load_dotenv()
 OPENAI_API_KEY = os.getenv("OPENAI_API_KEY")
 GEMINI_API_KEY = os.getenv("GEMINI_API_KEY")
 
-if not OPENAI_API_KEY or not GEMINI_API_KEY:
+# Request path limits (seconds / requests in flight per worker)
+MAX_CONCURRENT_REQUESTS = int(os.getenv("MAX_CONCURRENT_REQUESTS", "256"))
+QUEUE_TIMEOUT = float(os.getenv("QUEUE_TIMEOUT", "10"))
+EMBED_TIMEOUT = float(os.getenv("EMBED_TIMEOUT", "15"))
+GENERATE_TIMEOUT = float(os.getenv("GENERATE_TIMEOUT", "60"))
+
+# Retrieval: posts per answer, minimum cosine score, prompt context budget
+TOP_K = int(os.getenv("TOP_K", "3"))
+MIN_SCORE = float(os.getenv("MIN_SCORE", "0.3"))
+CONTEXT_TOKENS = int(os.getenv("CONTEXT_TOKENS", "6000"))
+
+# Shared index: attach to a published store only, check it for new generations
+INDEX_READ_ONLY = os.getenv("INDEX_READ_ONLY", "0") == "1"
+INDEX_POLL = float(os.getenv("INDEX_POLL", "5"))  # seconds, 0 = never reload
+
+# Per-stage timings are always on /metrics; SERVER_TIMING=1 also returns them per response
+SERVER_TIMING = os.getenv("SERVER_TIMING", "0") == "1"
+
+# OpenAI is only needed for embeddings; EMBED_BACKEND=ollama/local runs without it
+if not GEMINI_API_KEY or (os.getenv("EMBED_BACKEND", "openai") == "openai" and not OPENAI_API_KEY):
     raise RuntimeError("Missing API keys in environment variables")
 
+HTML_FILE = "fbpost.html"
+JSON_FILE = "facebook_posts.json"
+
+# =====================================================
+# Startup (scraping, index and clients, loaded lazily)
+# =====================================================
+# Set by load_services(); post_index is assigned last and marks readiness
+post_index = None
+answer_cache = None
+gemini = None
+startup_error = None
+request_slots = asyncio.Semaphore(MAX_CONCURRENT_REQUESTS)
+
+def load_services():
+    """Scrape on first run, open the index and create the clients (blocking)."""
+    global post_index, answer_cache, gemini
+    started = time.perf_counter()
+    from google import genai
+    from fb_scraper import scrape
+    from embeddings_manager import load_posts, load_post_index
+    from embedding_store import STORE_FILE, open_store
+    from ann_index import ANN_BACKEND, ann_params, load_ann, load_or_build_ann
+    from answer_cache import SemanticAnswerCache
+
+    if INDEX_READ_ONLY:
+        # Published by publish_index.py; ANN only if it matches this generation
+        from embeddings_manager import index_config
+        index = open_store(STORE_FILE, index_config())
+        if ANN_BACKEND != "none":
+            index.ann = load_ann(index.matrix, STORE_FILE, ANN_BACKEND, **ann_params())
+    else:
+        if not os.path.exists(JSON_FILE):
+            # Streaming parse: memory stays flat for large exports (fb_scraper.py)
+            scrape(HTML_FILE, JSON_FILE)
+        posts = load_posts(JSON_FILE)
+
+        # Memory-mapped float32 store (embedding_store.py); built batched and
+        # resumable on first run, or converted from a legacy embeddings.joblib
+        index = load_post_index(STORE_FILE, posts)
+        if ANN_BACKEND != "none":
+            index.ann = load_or_build_ann(index.matrix, STORE_FILE, ANN_BACKEND, **ann_params())
+
+    # Answers for (post, near-duplicate question) pairs, see answer_cache.py
+    answer_cache = SemanticAnswerCache.from_env()
+    # Created once and reused; /ask uses its async (.aio) interface
+    gemini = genai.Client(api_key=GEMINI_API_KEY)
+    post_index = index
+    print(f"✅ Ready in {time.perf_counter() - started:.1f}s ({len(index)} posts)")
+
+def reload_if_published(last_stamp):
+    """Swap in a newly published store generation (blocking); returns its stamp.
+
+    Requests already running keep the index they started with; the old
+    matrix stays mapped until the last of them drops it.
+    """
+    global post_index
+    from embedding_store import STORE_FILE, open_store, store_stamp
+    from embeddings_manager import index_config
+    from ann_index import ANN_BACKEND, ann_params, load_ann
+
+    stamp = store_stamp(STORE_FILE)
+    if stamp != last_stamp:
+        index = open_store(STORE_FILE, index_config())
+        if index.generation != post_index.generation:
+            if ANN_BACKEND != "none":
+                index.ann = load_ann(index.matrix, STORE_FILE, ANN_BACKEND, **ann_params())
+            post_index = index
+            print(f"♻️ Switched to index generation {index.generation} ({len(index)} posts)")
+    elif post_index.ann is None and ANN_BACKEND != "none":
+        # The publisher builds the ANN index after the store; pick it up late
+        post_index.ann = load_ann(post_index.matrix, STORE_FILE, ANN_BACKEND, **ann_params())
+    return stamp
+
+async def load_in_background():
+    global startup_error
+    while post_index is None:
+        try:
+            await asyncio.to_thread(load_services)
+        except Exception as e:
+            # e.g. INDEX_READ_ONLY before publish_index.py's first generation:
+            # /ready reports the error and loading is retried until it works
+            if startup_error is None:
+                traceback.print_exc()
+            else:
+                print(f"⚠️ Startup retry failed: {e}")
+            startup_error = e
+            await asyncio.sleep(INDEX_POLL or 5)
+    startup_error = None
+
+    stamp = None  # first check compares generations
+    while INDEX_POLL > 0:
+        await asyncio.sleep(INDEX_POLL)
+        try:
+            stamp = await asyncio.to_thread(reload_if_published, stamp)
+        except (OSError, RuntimeError) as e:
+            # Mid-publish (a generation replaced while opening), or a store
+            # from another embedder or chunking: keep serving the current one
+            print(f"⚠️ Index reload skipped: {e}")
+
+@asynccontextmanager
+async def lifespan(app):
+    # Not awaited: the port is bound right away and /ready reports progress
+    loader = asyncio.create_task(load_in_background())
+    yield
+    loader.cancel()
+
 # =====================================================
 # FastAPI App Initialization
 # =====================================================
 app = FastAPI(
+    lifespan=lifespan,
     title="SMASB BOT",
     version="1.0.0",
     description="""
@@ -47,118 +181,268 @@ app = FastAPI(
     }
 )
 
-# =====================================================
-# Data Loading & Scraping
-# =====================================================
-HTML_FILE = "fbpost.html"
-JSON_FILE = "facebook_posts.json"
-EMBED_FILE = "embeddings.joblib"
-
-if not os.path.exists(JSON_FILE):
-    with open(HTML_FILE, "r", encoding="utf-8") as f:
-        html = f.read()
-    soup = BeautifulSoup(html, "html.parser")
-    posts = [
-        {"post": i, "content": p.get_text(strip=True)}
-        for i, p in enumerate(soup.find_all("div", class_="_2pin"), start=1)
-    ]
-    with open(JSON_FILE, "w", encoding="utf-8") as f:
-        json.dump(posts, f, ensure_ascii=False, indent=2)
-else:
-    with open(JSON_FILE, "r", encoding="utf-8") as f:
-        posts = json.load(f)
-
-# =====================================================
-# Embedding Functions
-# =====================================================
-enc = encoding_for_model("text-embedding-3-small")
-openai_client = OpenAI(api_key=OPENAI_API_KEY)
-
-def chunk_text(text, max_tokens=7000):
-    tokens = enc.encode(text)
-    return [enc.decode(tokens[i:i + max_tokens]) for i in range(0, len(tokens), max_tokens)]
-
-def get_embeddings(text):
-    vectors = []
-    for chunk in chunk_text(text):
-        emb = openai_client.embeddings.create(
-            model="text-embedding-3-small",
-            input=chunk
-        ).data[0].embedding
-        vectors.append(np.array(emb))
-    return vectors
-
-if os.path.exists(EMBED_FILE):
-    post_embeddings = joblib.load(EMBED_FILE)
-else:
-    post_embeddings = [
-        {"post": p, "embeddings": get_embeddings(p["content"])}
-        for p in posts
-    ]
-    joblib.dump(post_embeddings, EMBED_FILE)
-
-# =====================================================
-# Similarity Search
-# =====================================================
-def find_best_post(query):
-    query_embeddings = get_embeddings(query)
-    best_score = 0
-    best_post = None
-
-    for item in post_embeddings:
-        for q in query_embeddings:
-            for p in item["embeddings"]:
-                score = cosine_similarity([q], [p])[0][0]
-                if score > best_score:
-                    best_score = score
-                    best_post = item["post"]
-
-    return best_post
-
 # =====================================================
 # API Request/Response Models
 # =====================================================
 class QueryRequest(BaseModel):
     question: str
+    exact: bool = True  # False -> approximate (ANN) search, if ANN_BACKEND is set
+    top_k: int = Field(TOP_K, ge=1, le=10)  # posts used as context
 
 class QueryResponse(BaseModel):
     answer: str
     source_post: int
+    sources: list[int] = []
+    scores: list[float] = []
 
 # =====================================================
 # API Endpoints
 # =====================================================
 @app.get("/")
 def health_check():
-    return {"status": "ok", "message": "SMASB BOT API running"}
+    # Liveness only: answers while the index is still loading
+    ready = post_index is not None
+    return {
+        "status": "ok",
+        "message": "SMASB BOT API running",
+        "ready": ready,
+        "query_cache": query_cache_stats() if ready else None,
+        "answer_cache": answer_cache.stats() if ready else None
+    }
 
-@app.post("/ask", response_model=QueryResponse)
-def ask_question(payload: QueryRequest):
-    post = find_best_post(payload.question)
+def query_cache_stats():
+    from embeddings_manager import query_cache
+    return query_cache.stats()
+
+@app.get("/ready")
+def readiness_check():
+    if post_index is not None:
+        return {"status": "ready", "posts": len(post_index), "generation": post_index.generation}
+    if startup_error is not None:
+        return JSONResponse({"status": "failed", "detail": str(startup_error)}, status_code=503)
+    return JSONResponse({"status": "loading"}, status_code=503)
+
+@app.get("/metrics")
+def prometheus_metrics():
+    if post_index is not None:
+        # The query cache keeps its own counters (it is also hit outside requests)
+        from embeddings_manager import query_cache
+        query_stats = query_cache.stats()
+        for result, key in (("hit", "hits"), ("disk_hit", "disk_hits"), ("miss", "misses")):
+            metrics.set("query_cache_lookups_total", query_stats[key], kind="counter", result=result)
+        metrics.set("cache_entries", query_stats["size"], cache="query")
+        metrics.set("cache_entries", answer_cache.stats()["size"], cache="answer")
+        metrics.set("index_posts", len(post_index))
+        metrics.set("index_rows", len(post_index.matrix))
+        metrics.set("index_generation", post_index.generation)
+    return PlainTextResponse(metrics.render(), media_type="text/plain; version=0.0.4")
+
+@app.middleware("http")
+async def time_request(request: Request, call_next):
+    timer = RequestTimer()
+    token = current_timer.set(timer)
+    started = time.perf_counter()
+    try:
+        response = await call_next(request)
+    finally:
+        current_timer.reset(token)
+    seconds = time.perf_counter() - started
+
+    # Label by route, so unknown URLs cannot create unbounded series
+    known = {getattr(route, "path", None) for route in app.routes}
+    path = request.url.path if request.url.path in known else "other"
+    metrics.observe("request_seconds", seconds, path=path)
+    metrics.inc("requests_total", path=path, status=response.status_code)
+    if SERVER_TIMING and (timer.spans or timer.notes):
+        # Streaming responses only include the stages before the first byte
+        response.headers["Server-Timing"] = f"{timer.server_timing()}, total;dur={seconds * 1000:.1f}"
+    return response
+
+def record_usage(usage):
+    """Gemini's own token counts, when the response reports them."""
+    if usage is not None:
+        record_tokens("gemini_prompt", usage.prompt_token_count)
+        record_tokens("gemini_answer", usage.candidates_token_count)
+
+async def acquire_slot():
+    if post_index is None:
+        raise HTTPException(status_code=503, detail="Index is still loading, please retry")
+    try:
+        with span("queue"):
+            await asyncio.wait_for(request_slots.acquire(), QUEUE_TIMEOUT)
+    except asyncio.TimeoutError:
+        raise HTTPException(status_code=503, detail="Server busy, please retry")
 
-    if not post:
+def search_context(index, query_embeddings, payload):
+    """Search and pack the context (blocking); returns (hits, context).
+
+    Both scan memory-mapped rows and tokenize, so /ask runs this in a
+    thread to keep the event loop free for the requests in flight.
+    """
+    from embeddings_manager import enc, chunk_text
+    from rag_context import build_context
+    from ann_index import ANN_CANDIDATES
+    with span("search"):
+        hits = index.search_chunks(
+            query_embeddings, k=payload.top_k, min_score=MIN_SCORE, exact=payload.exact,
+            n_candidates=ANN_CANDIDATES
+        )
+    with span("context"):
+        context, hits = build_context(hits, chunk_text, enc, CONTEXT_TOKENS)
+        record_tokens("question", len(enc.encode(payload.question)))
+        record_tokens("context", len(enc.encode(context)))
+    return hits, context
+
+async def retrieve(payload: QueryRequest):
+    """Embed the question and pack the top-k chunks into the prompt.
+
+    Returns (hits, query_embeddings, prompt); hits are (post, chunk_no, score).
+    """
+    from embeddings_manager import aget_embedding_safe
+    from rag_context import build_prompt
+    try:
+        with span("embed"):
+            query_embeddings = await asyncio.wait_for(
+                aget_embedding_safe(payload.question), EMBED_TIMEOUT
+            )
+    except asyncio.TimeoutError:
+        raise HTTPException(status_code=504, detail="Embedding request timed out")
+    # Spans still reach this request's timer: to_thread copies the context
+    hits, context = await asyncio.to_thread(search_context, post_index, query_embeddings, payload)
+
+    if not hits:
         raise HTTPException(
             status_code=404,
             detail="کوئی متعلقہ پوسٹ نہیں ملی"
         )
 
-    prompt = f"""
-Context:
-{post['content']}
+    return hits, query_embeddings, build_prompt(context, payload.question)
 
-Question:
-{payload.question}
+def source_fields(hits):
+    return {
+        "source_post": hits[0][0]["post"],
+        "sources": [post["post"] for post, _, _ in hits],
+        "scores": [round(score, 4) for _, _, score in hits]
+    }
 
-Answer in simple Urdu.
-"""
+def context_key(hits):
+    """Answer-cache key: the context's content, not which duplicate post held it."""
+    from embeddings_manager import content_hash
+    return tuple((content_hash(post["content"]), chunk_no) for post, chunk_no, _ in hits)
 
-    gemini = genai.Client(api_key=GEMINI_API_KEY)
-    response = gemini.models.generate_content(
-        model="gemini-2.5-flash",
-        contents=prompt
-    )
+@app.post("/ask", response_model=QueryResponse)
+async def ask_question(payload: QueryRequest):
+    await acquire_slot()
+    try:
+        return await answer_question(payload)
+    finally:
+        request_slots.release()
 
-    return {
-        "answer": response.text,
-        "source_post": post["post"]
-    }
+async def answer_question(payload: QueryRequest):
+    hits, query_embeddings, prompt = await retrieve(payload)
+    cache_key = context_key(hits)
+
+    with span("answer_cache"):
+        answer = answer_cache.lookup(cache_key, query_embeddings)
+    record_cache("answer", answer is not None)
+    if answer is None:
+        try:
+            with span("generate"):
+                response = await asyncio.wait_for(
+                    gemini.aio.models.generate_content(
+                        model="gemini-2.5-flash",
+                        contents=prompt
+                    ),
+                    GENERATE_TIMEOUT
+                )
+        except asyncio.TimeoutError:
+            raise HTTPException(status_code=504, detail="Answer generation timed out")
+        record_usage(getattr(response, "usage_metadata", None))
+        answer = response.text
+        answer_cache.store(cache_key, query_embeddings, answer)
+
+    return {"answer": answer, **source_fields(hits)}
+
+# =====================================================
+# Streaming Endpoint (Server-Sent Events)
+# =====================================================
+def sse(data, event=None):
+    payload = json.dumps(data, ensure_ascii=False)
+    return f"event: {event}\ndata: {payload}\n\n" if event else f"data: {payload}\n\n"
+
+class SlotStreamingResponse(StreamingResponse):
+    """Releases the request slot when sending ends, however it ends.
+
+    A generator's ``finally`` would only run if the body is iterated, which
+    a client that disconnects before streaming starts never causes.
+    """
+
+    async def __call__(self, scope, receive, send):
+        try:
+            await super().__call__(scope, receive, send)
+        finally:
+            request_slots.release()
+
+@app.post("/ask/stream")
+async def ask_question_stream(payload: QueryRequest):
+    """Same as /ask, but the answer is sent as SSE ``data`` events as it is generated.
+
+    Events: ``source`` (post ids and scores) first, then ``{"text": ...}`` pieces, then
+    ``done`` -- or ``error`` if generation fails midway.
+    """
+    await acquire_slot()
+    try:
+        hits, query_embeddings, prompt = await retrieve(payload)
+    except BaseException:
+        request_slots.release()
+        raise
+
+    cache_key = context_key(hits)
+
+    async def events():
+        try:
+            yield sse(source_fields(hits), event="source")
+            with span("answer_cache"):
+                answer = answer_cache.lookup(cache_key, query_embeddings)
+            record_cache("answer", answer is not None)
+            if answer is not None:
+                yield sse({"text": answer})
+            else:
+                loop = asyncio.get_running_loop()
+                started = loop.time()
+                deadline = loop.time() + GENERATE_TIMEOUT
+                stream = await asyncio.wait_for(
+                    gemini.aio.models.generate_content_stream(
+                        model="gemini-2.5-flash",
+                        contents=prompt
+                    ),
+                    GENERATE_TIMEOUT
+                )
+                pieces, usage = [], None
+                stream_iter = stream.__aiter__()
+                while True:
+                    try:
+                        chunk = await asyncio.wait_for(stream_iter.__anext__(), deadline - loop.time())
+                    except StopAsyncIteration:
+                        break
+                    if not pieces and chunk.text:
+                        metrics.observe("stage_seconds", loop.time() - started, stage="first_token")
+                    usage = getattr(chunk, "usage_metadata", None) or usage
+                    if chunk.text:
+                        pieces.append(chunk.text)
+                        yield sse({"text": chunk.text})
+                metrics.observe("stage_seconds", loop.time() - started, stage="generate")
+                record_usage(usage)
+                answer = "".join(pieces)
+                answer_cache.store(cache_key, query_embeddings, answer)
+            yield sse(source_fields(hits), event="done")
+        except asyncio.TimeoutError:
+            yield sse({"detail": "Answer generation timed out"}, event="error")
+        except Exception as e:
+            yield sse({"detail": str(e)}, event="error")
+
+    return SlotStreamingResponse(
+        events(),
+        media_type="text/event-stream",
+        headers={"Cache-Control": "no-cache", "X-Accel-Buffering": "no"}
+    )
@@ -0,0 +1,200 @@
+# vector_index.py
+"""
+SMASB BOT - Vector Index
+Description:
+    Keeps every post chunk embedding in one contiguous, L2-normalised
+    float32 matrix. A query is scored against the whole corpus with a
+    single matrix product, then reduced to the best chunk per post.
+    An optional ANN index (see ann_index.py) can narrow the rows scored.
+"""
+
+import numpy as np
+
+
+def normalize_rows(vectors):
+    vectors = np.asarray(vectors, dtype=np.float32)
+    if vectors.ndim == 1:
+        vectors = vectors[None, :]
+    norms = np.linalg.norm(vectors, axis=1, keepdims=True)
+    norms[norms == 0] = 1.0
+    return vectors / norms
+
+
+class VectorIndex:
+    """Cosine search over post chunks.
+
+    matrix     -- (n_chunks, dim) float32, every row normalised
+    offsets    -- first matrix row of each post; a post's chunks are contiguous
+    chunk_post -- (n_chunks,) position in ``posts`` that owns each row
+    posts      -- the post dicts, in the same order as ``offsets``
+    hashes     -- optional content hash of each post; identical posts are
+                  then one post to ``search_chunks``
+    ann        -- optional ANN index used when ``exact=False``
+    """
+
+    def __init__(self, matrix, offsets, posts):
+        self.matrix = matrix
+        self.offsets = np.asarray(offsets, dtype=np.int64)
+        self.posts = posts
+        counts = np.diff(np.append(self.offsets, len(matrix)))
+        self.chunk_post = np.repeat(np.arange(len(posts), dtype=np.int32), counts)
+        self.hashes = None
+        self.ann = None
+
+    @classmethod
+    def from_post_embeddings(cls, post_embeddings):
+        """Build from the ``[{"post": ..., "embeddings": [...]}, ...]`` list."""
+        posts, offsets, rows = [], [], []
+        for item in post_embeddings:
+            if len(item["embeddings"]) == 0:
+                continue
+            posts.append(item["post"])
+            offsets.append(len(rows))
+            rows.extend(item["embeddings"])
+        if rows:
+            matrix = normalize_rows(np.vstack(rows))
+        else:
+            matrix = np.zeros((0, 0), dtype=np.float32)
+        return cls(np.ascontiguousarray(matrix), offsets, posts)
+
+    def __len__(self):
+        return len(self.posts)
+
+    @property
+    def dim(self):
+        return self.matrix.shape[1]
+
+    def quantized(self):
+        """The ANN index if it bounds its own error (QuantizedIndex).
+
+        Such an index replaces the float32 scan even for exact search.
+        """
+        return self.ann if hasattr(self.ann, "error_bounds") else None
+
+    def row_scores(self, rows, queries):
+        return (self.matrix[rows] @ queries.T).max(axis=1)
+
+    def quantized_rows(self, queries, n_candidates, floor=None):
+        """Rows and their exact scores, found through the quantised codes.
+
+        Every row is coarse-scored from the codes and the best
+        ``n_candidates`` are re-scored from the float32 matrix. With
+        ``floor(rows, scores)`` -- a lower bound on the worst score the
+        result can contain -- every other row whose coarse score plus its
+        error bound exceeds it is re-scored too, so no row that belongs in
+        the result is missed. Returns (coarse scores, rows, exact scores).
+        """
+        ann = self.ann
+        coarse = ann.coarse_scores(queries)
+        n = min(n_candidates, len(coarse))
+        rows = np.sort(np.argpartition(-coarse, n - 1)[:n])
+        scores = self.row_scores(rows, queries)
+        if floor is not None:
+            upper = coarse + ann.error_bounds(queries)
+            upper[rows] = -np.inf
+            extra = np.flatnonzero(upper > floor(rows, scores))
+            if len(extra):
+                rows = np.concatenate([rows, extra])
+                scores = np.concatenate([scores, self.row_scores(extra, queries)])
+        return coarse, rows, scores
+
+    def post_scores(self, query_vectors, k=1):
+        """Best cosine score of every post over all (query chunk, post chunk) pairs.
+
+        With a quantised index the best ``k`` posts get exact scores and
+        the rest are within the quantisation error bound.
+        """
+        queries = normalize_rows(query_vectors)
+        if self.quantized() is None:
+            chunk_scores = (self.matrix @ queries.T).max(axis=1)
+            return np.maximum.reduceat(chunk_scores, self.offsets)
+
+        def floor(rows, scores):
+            best = np.full(len(self.posts), -np.inf, dtype=np.float32)
+            np.maximum.at(best, self.chunk_post[rows], scores)
+            n = min(k, len(best))
+            return -np.partition(-best, n - 1)[n - 1]
+
+        chunk_scores, rows, scores = self.quantized_rows(queries, max(64, 4 * k), floor)
+        chunk_scores[rows] = scores
+        return np.maximum.reduceat(chunk_scores, self.offsets)
+
+    def approx_post_scores(self, query_vectors, n_candidates):
+        """Like ``post_scores`` but only rows proposed by the ANN index are scored."""
+        queries = normalize_rows(query_vectors)
+        rows = self.ann.candidates(queries, n_candidates)
+        scores = np.full(len(self.posts), -np.inf, dtype=np.float32)
+        if len(rows):
+            np.maximum.at(scores, self.chunk_post[rows], self.row_scores(rows, queries))
+        return scores
+
+    def scores(self, query_vectors, exact=True, n_candidates=64, k=1):
+        """Per-post scores, exact or (with an ANN index) approximate."""
+        if exact or self.ann is None:
+            return self.post_scores(query_vectors, k)
+        return self.approx_post_scores(query_vectors, n_candidates)
+
+    def search(self, query_vectors, k=1, min_score=0.0, exact=True, n_candidates=64):
+        """Return up to ``k`` ``(post, score)`` pairs, best first.
+
+        Only posts scoring strictly above ``min_score`` are returned, which
+        keeps the old ``best_score = 0`` behaviour as the default. With
+        ``exact=False`` and an ANN index attached, only ``n_candidates``
+        chunks per query chunk are re-scored.
+        """
+        if len(query_vectors) == 0 or len(self.posts) == 0:
+            return []
+        scores = self.scores(query_vectors, exact, max(n_candidates, 4 * k), k)
+        k = min(k, len(scores))
+        top = np.argpartition(-scores, k - 1)[:k]
+        top = top[np.argsort(-scores[top])]
+        return [(self.posts[i], float(scores[i])) for i in top if scores[i] > min_score]
+
+    def search_chunks(self, query_vectors, k=3, min_score=0.0, exact=True, per_post=1, n_candidates=64):
+        """Top-``k`` chunks as ``(post, chunk_no, score)``, best first.
+
+        At most ``per_post`` chunks are kept from any one post, so the
+        context is spread over several posts instead of repeating one.
+        Posts with the same ``hashes`` entry (duplicates) count as one
+        post. ``chunk_no`` is the chunk's position within its post.
+        """
+        if len(query_vectors) == 0 or len(self.posts) == 0:
+            return []
+        queries = normalize_rows(query_vectors)
+        n_candidates = max(n_candidates, 4 * k * per_post)
+        if self.quantized() is not None:
+            def floor(rows, scores):
+                hits = self.select_chunks(rows, scores, k, min_score, per_post)
+                return max(hits[-1][2], min_score) if len(hits) == k else min_score
+
+            _, rows, scores = self.quantized_rows(queries, n_candidates, floor if exact else None)
+        elif exact or self.ann is None:
+            rows = np.arange(len(self.matrix))
+            scores = (self.matrix @ queries.T).max(axis=1)
+        else:
+            rows = self.ann.candidates(queries, n_candidates)
+            scores = self.row_scores(rows, queries)
+        return self.select_chunks(rows, scores, k, min_score, per_post)
+
+    def select_chunks(self, rows, scores, k, min_score, per_post):
+        """The best ``k`` of ``rows`` (exact ``scores``), at most ``per_post`` per post."""
+        if len(rows) == 0:
+            return []
+        # Usually the best few rows already cover k posts; sort more only if not
+        n_top = min(len(rows), 8 * k * per_post)
+        while True:
+            top = np.argpartition(-scores, n_top - 1)[:n_top] if n_top < len(rows) else np.arange(len(rows))
+            top = top[np.argsort(-scores[top])]
+            hits, taken = [], {}
+            for i in top:
+                if scores[i] <= min_score or len(hits) == k:
+                    break
+                owner = self.chunk_post[rows[i]]
+                # Duplicate posts share a content hash and would repeat the text
+                key = self.hashes[owner] if self.hashes is not None else owner
+                if taken.get(key, 0) < per_post:
+                    taken[key] = taken.get(key, 0) + 1
+                    hits.append((self.posts[owner], int(rows[i] - self.offsets[owner]), float(scores[i])))
+            if len(hits) == k or n_top == len(rows) or scores[top[-1]] <= min_score:
+                return hits
+            n_top = min(len(rows), n_top * 4)